@@ -0,0 +1,209 @@
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial variants share a key"""
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+class AnswerCache:
+    """Bounded LRU cache of RAG answers with a TTL.
+
+    Lookups first try the normalized question text; when an embeddings model is set,
+    a miss falls back to the most similar cached question whose cosine similarity is at
+    least similarity_threshold. An optional scope (e.g. the caller's map cell) partitions
+    entries so location-specific answers are only shared within the same scope.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0,
+                 similarity_threshold: float = 0.95, embeddings=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.embeddings = embeddings
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _embed(self, key: str, embed: Optional[Callable[[], Any]] = None) -> Optional[np.ndarray]:
+        if self.embeddings is None:
+            return None
+        vector = np.array(embed() if embed is not None else self.embeddings.embed_query(key), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, question: str, scope: str = "", embed: Optional[Callable[[], Any]] = None) -> Optional[Any]:
+        """Return the cached value for a question (or a near-identical one), or None.
+
+        embed, if given, returns the question's vector already computed for this request;
+        otherwise the normalized question is embedded here.
+        """
+        normalized = normalize_question(question)
+        key = f"{scope}\0{normalized}"
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["value"]
+            candidates = [(k, e["vector"]) for k, e in self._entries.items()
+                          if e["vector"] is not None and e["scope"] == scope]
+
+        vector = self._embed(normalized, embed) if candidates else None
+        if vector is not None:
+            similarities = np.stack([v for _, v in candidates]) @ vector
+            best = int(similarities.argmax())
+            if similarities[best] >= self.similarity_threshold:
+                with self._lock:
+                    entry = self._entries.get(candidates[best][0])
+                    if entry is not None:
+                        self.semantic_hits += 1
+                        return entry["value"]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, question: str, value: Any, scope: str = "", embed: Optional[Callable[[], Any]] = None):
+        """Cache a value for a question, evicting the least recently used entries if full"""
+        normalized = normalize_question(question)
+        key = f"{scope}\0{normalized}"
+        vector = self._embed(normalized, embed)
+        with self._lock:
+            self._entries[key] = {"value": value, "vector": vector, "scope": scope, "created": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every cached answer, e.g. after the location data or vector store changed"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0
+            }
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution shared by all callers"""
+
+    def __init__(self):
+        self._calls: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.deduplicated = 0
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """Run func for key, or wait for the identical call already in flight and share its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+                self.executions += 1
+            else:
+                self.deduplicated += 1
+
+        if not leader:
+            call["done"].wait()
+        else:
+            try:
+                call["result"] = func()
+            except BaseException as e:
+                call["error"] = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call["done"].set()
+
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
+
+    def stats(self) -> Dict:
+        """Execution and deduplication counters"""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executions": self.executions,
+                "deduplicated": self.deduplicated
+            }
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop: callers with the key of a call in flight
+    await its result instead of starting their own, so they hold no other resources meanwhile"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.executions = 0
+        self.deduplicated = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Await func() for key, or the identical call already in flight and share its result"""
+        while True:
+            call = self._calls.get(key)
+            if call is None:
+                break
+            self.deduplicated += 1
+            try:
+                return await asyncio.shield(call)
+            except asyncio.CancelledError:
+                # Only the first caller was cancelled (e.g. its client went away): run it here
+                if not call.cancelled():
+                    raise
+
+        call = self._calls[key] = asyncio.get_running_loop().create_future()
+        # Mark the outcome retrieved, so an error nobody else waited for is not reported as lost
+        call.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self.executions += 1
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> Dict:
+        """Execution and deduplication counters"""
+        return {
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "deduplicated": self.deduplicated
+        }
@@ -1,14 +1,320 @@
 # api_server.py
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Header, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from chatbot import IsraelSafetyRAGBot
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from answer_cache import AsyncSingleFlight
+from chatbot import DANGER_TYPES, SAFETY_TYPES, IsraelSafetyRAGBot
+from map_layers import MAX_ZOOM, layer_features, tile_bounds
+from metrics import REGISTRY, Gauge, Histogram, logger as log, setup_async_logging
 import uvicorn
 import pandas as pd
 from datetime import datetime
-import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+# Log records are handed to a background thread, so request handlers never block on output
+log_listener = setup_async_logging(getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO))
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "safety_bot_http_request_seconds", "Time until the response starts, per endpoint",
+    ["endpoint", "method", "status"]))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "safety_bot_http_requests_in_flight", "Requests being handled, per endpoint", ["endpoint"]))
+
+# Batches larger than this are streamed back as NDJSON, computed this many points at a time
+BATCH_JSON_MAX_POINTS = 500
+BATCH_STREAM_CHUNK = 1000
+
+# Map layer groups accepted in ?types= besides the location types themselves
+LAYER_GROUPS = {"safety": SAFETY_TYPES, "danger": DANGER_TYPES}
+# Encoded map responses kept per ETag (which covers the data snapshot and the query)
+MAP_CACHE_ENTRIES = 512
+map_layer_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+# LLM calls run on a dedicated thread pool so the event loop keeps serving other endpoints.
+# At most LLM_CONCURRENCY chains run at once; up to LLM_MAX_QUEUE more wait for a slot.
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "2"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+llm_executor = ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix="llm")
+llm_slots = asyncio.Semaphore(LLM_CONCURRENCY)
+llm_waiting = 0
+llm_active = 0
+
+@asynccontextmanager
+async def llm_slot():
+    """Wait for one of the LLM_CONCURRENCY slots, rejecting with 503 when the queue is full"""
+    global llm_waiting, llm_active
+    if llm_waiting >= LLM_MAX_QUEUE:
+        raise HTTPException(status_code=503, detail="Too many questions in progress, please retry shortly")
+    
+    llm_waiting += 1
+    try:
+        await llm_slots.acquire()
+    finally:
+        llm_waiting -= 1
+    
+    llm_active += 1
+    try:
+        yield
+    finally:
+        llm_active -= 1
+        llm_slots.release()
+
+# Identical questions arriving while one is answered await its answer here, before taking an LLM slot
+inflight_answers = AsyncSingleFlight()
+
+async def run_llm_call(func, *args):
+    """Run a blocking LLM call off the event loop, bounded by LLM_CONCURRENCY with a queue"""
+    async with llm_slot():
+        return await asyncio.get_running_loop().run_in_executor(llm_executor, func, *args)
+
+CSV_FILES = ["bunker.csv", "embassies.csv", "bunkers.csv", "heat.csv"]
+
+# Seconds between checks of the CSV files for changes (0 disables the watcher).
+# When ADMIN_TOKEN is set, /admin/reload requires it in the X-Admin-Token header.
+CSV_WATCH_INTERVAL = float(os.getenv("CSV_WATCH_INTERVAL", "5"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Multi-worker mode (WORKERS > 1, or several servers sharing this directory): the process holding
+# BUILDER_LOCK parses the CSV files, writes the location snapshot and syncs the vector collection.
+# The other processes memory-map that snapshot and use the collection read-only, so the data is
+# parsed and embedded once and its pages are shared. BUILD_STATE tells them which data the
+# collection was last synced for; a new builder resets it as soon as it holds the lock, and state
+# left by a process that is gone is ignored. If the builder exits, the next worker to notice takes over.
+WORKERS = int(os.getenv("WORKERS", "1"))
+BUILDER_LOCK = os.getenv("BUILDER_LOCK", "./.bot_builder.lock")
+BUILD_STATE = os.getenv("BUILD_STATE", "./.bot_build.json")
+WORKER_POLL_INTERVAL = 0.5
+
+try:
+    import fcntl
+except ImportError:  # No flock (Windows): every process builds its own data
+    fcntl = None
+
+builder_lock_file = None
+# Worker: the build ETag its vector collection was last opened for
+worker_vectors_etag: Optional[str] = None
+
+# The bot is built in the background after the server starts. Readiness states:
+# starting -> loading_data -> indexing (location endpoints live) -> ready (RAG live), or failed;
+# workers start in waiting_for_builder until the builder's snapshot is available
+bot = IsraelSafetyRAGBot(model_name="gemma3:1b")
+# Prompt length drives time-to-first-token on CPU hosts, so retrieved context is capped
+bot.context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", str(bot.context_token_budget)))
+readiness = {
+    "state": "starting",
+    "role": None,
+    "data_ready": False,
+    "rag_ready": False,
+    "error": None,
+    "timings": {}
+}
+
+def try_become_builder() -> bool:
+    """Take the builder lock without waiting; it is held until this process exits"""
+    global builder_lock_file
+    if builder_lock_file is not None or fcntl is None:
+        return True
+    lock_file = open(BUILDER_LOCK, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    builder_lock_file = lock_file
+    # Whatever an earlier builder published no longer applies
+    write_build_state(None)
+    return True
+
+def write_build_state(etag: Optional[str], error: Optional[str] = None):
+    """Publish which data the vector collection is synced for (or that it is being built, or why
+    building failed) to the workers"""
+    state = "ready" if etag else "failed" if error else "building"
+    temporary = f"{BUILD_STATE}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump({"state": state, "etag": etag, "error": error, "pid": os.getpid(), "updated": time.time()}, f)
+    os.replace(temporary, BUILD_STATE)
+
+def process_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def read_build_state() -> Optional[dict]:
+    """The state published by a running builder, or None (also for one left by an exited process)"""
+    try:
+        with open(BUILD_STATE, encoding="utf-8") as f:
+            build = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return build if process_alive(build.get("pid")) else None
+
+def initialize_bot():
+    """Load the location data, then the vector store and QA chain, updating readiness as each part comes up"""
+    log.info("🤖 Initializing Emergency Safety Bot...")
+    started = time.perf_counter()
+    try:
+        if not try_become_builder():
+            readiness["role"] = "worker"
+            readiness["state"] = "waiting_for_builder"
+            log.info("⏳ Another process is building the data, waiting to attach to it...")
+            while not attach_to_builder(started):
+                time.sleep(WORKER_POLL_INTERVAL)
+                if try_become_builder():
+                    log.warning("🛠️ The builder process exited, building the data here instead")
+                    readiness["error"] = None
+                    break
+            else:
+                log.info("✅ Worker attached to the shared data!")
+                return
+        
+        readiness["role"] = "builder"
+        readiness["state"] = "loading_data"
+        if not bot.load_csv_data(CSV_FILES):
+            raise RuntimeError("CSV data could not be loaded")
+        readiness["timings"]["data_seconds"] = round(time.perf_counter() - started, 3)
+        readiness["data_ready"] = True
+        readiness["state"] = "indexing"
+        log.info("📍 Location data ready, building the vector store...")
+        
+        # The persisted vector collection is reused and only changed rows are re-embedded
+        if not (bot.setup_vectorstore() and bot.setup_qa_chain()):
+            raise RuntimeError("Vector store or QA chain setup failed")
+        write_build_state(bot.store.etag)
+        readiness["timings"]["rag_seconds"] = round(time.perf_counter() - started, 3)
+        readiness["rag_ready"] = True
+        readiness["state"] = "ready"
+        log.info("✅ Bot initialized successfully!")
+    except Exception as e:
+        readiness["state"] = "failed"
+        readiness["error"] = str(e)
+        if readiness["role"] == "builder":
+            write_build_state(None, str(e))
+        log.error(f"❌ Error initializing bot: {e}")
+
+def attach_to_builder(started: float) -> bool:
+    """Worker side: use the builder's snapshot of the current CSV files, then its vector collection
+    once it is synced for that data. True when questions can be answered."""
+    global worker_vectors_etag
+    if not bot.attach_snapshot(CSV_FILES):
+        return False
+    if not readiness["data_ready"]:
+        readiness["timings"]["data_seconds"] = round(time.perf_counter() - started, 3)
+        readiness["data_ready"] = True
+        readiness["state"] = "indexing"
+    
+    build = read_build_state()
+    if not readiness["rag_ready"] and build is not None:
+        if build["error"]:
+            # Keep waiting: a restarted builder may succeed, or this worker takes over once it exits
+            if readiness["error"] is None:
+                log.warning(f"⚠️ Builder process failed, waiting for a new builder: {build['error']}")
+            readiness["error"] = f"Builder process failed: {build['error']}"
+        elif build["etag"] == bot.store.etag:
+            if not (bot.setup_vectorstore(sync=False) and bot.setup_qa_chain()):
+                raise RuntimeError("Vector store or QA chain setup failed")
+            worker_vectors_etag = build["etag"]
+            readiness["timings"]["rag_seconds"] = round(time.perf_counter() - started, 3)
+            readiness["rag_ready"] = True
+            readiness["state"] = "ready"
+            readiness["error"] = None
+    return readiness["rag_ready"]
+
+def refresh_worker_vectors() -> bool:
+    """Worker: reopen the vector collection once the builder has published a sync for the data this
+    worker now serves, so searches see the new vectors. True if it was reopened."""
+    global worker_vectors_etag
+    build = read_build_state()
+    if not readiness["rag_ready"] or build is None or not build["etag"]:
+        return False
+    if build["etag"] == worker_vectors_etag or build["etag"] != bot.store.etag:
+        return False
+    bot.reopen_vectorstore()
+    worker_vectors_etag = build["etag"]
+    log.info("🔄 Reopened the shared vector database for the builder's latest sync")
+    return True
+
+def reload_data_files() -> dict:
+    """Builder: re-read the changed CSV files and publish the result. Worker: attach to the builder's
+    latest snapshot, taking over as builder if it has exited."""
+    if readiness["role"] == "worker":
+        if not try_become_builder():
+            etag = bot.store.etag
+            attached = bot.attach_snapshot(CSV_FILES)
+            return {"role": "worker", "attached": attached, "updated": attached and bot.store.etag != etag,
+                    "vectors_reopened": refresh_worker_vectors(), "records": len(bot.store)}
+        log.warning("🛠️ The builder process exited, this worker takes over reloading")
+        readiness["role"] = "builder"
+        if readiness["rag_ready"]:
+            # The exited builder may have stopped halfway through a sync, and this process's
+            # vector index may predate its last one
+            bot.reopen_vectorstore()
+            bot.sync_vectorstore()
+            write_build_state(bot.store.etag)
+    
+    result = bot.reload_csv_data()
+    if result["changed"] and readiness["rag_ready"]:
+        write_build_state(bot.store.etag)
+    return {"role": "builder", **result}
 
-app = FastAPI(title="Israel Emergency Safety Bot API")
+def require_data():
+    """Reject the request until the location data and spatial index are loaded"""
+    if not readiness["data_ready"]:
+        _raise_not_ready("Location data is still loading")
+
+def require_rag():
+    """Reject the request until the vector store and QA chain are ready"""
+    if not readiness["rag_ready"]:
+        _raise_not_ready("The question answering system is still starting")
+
+def _raise_not_ready(message: str):
+    if readiness["state"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Bot initialization failed: {readiness['error']}")
+    raise HTTPException(status_code=503, detail=f"{message}, please retry shortly", headers={"Retry-After": "5"})
+
+def watch_csv_files(stop: threading.Event):
+    """Poll the CSV files and hot-reload the ones that changed (workers follow the builder instead)"""
+    while not stop.wait(CSV_WATCH_INTERVAL):
+        if not readiness["rag_ready" if readiness["role"] == "worker" else "data_ready"]:
+            continue
+        try:
+            result = reload_data_files()
+            if result.get("failed"):
+                log.warning(f"⚠️ Could not reload {', '.join(result['failed'])}, keeping the previous data")
+        except Exception as e:
+            log.error(f"❌ Error reloading CSV data: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Initialize off the event loop so the port is bound and /ready answers immediately
+    threading.Thread(target=initialize_bot, name="bot-init", daemon=True).start()
+    stop_watching = threading.Event()
+    if CSV_WATCH_INTERVAL > 0:
+        threading.Thread(target=watch_csv_files, args=(stop_watching,), name="csv-watch", daemon=True).start()
+    yield
+    stop_watching.set()
+    llm_executor.shutdown(wait=False, cancel_futures=True)
+    log_listener.stop()
+
+app = FastAPI(title="Israel Emergency Safety Bot API", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -19,76 +325,211 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize bot
-print("🤖 Initializing Emergency Safety Bot...")
-try:
-    bot = IsraelSafetyRAGBot(model_name="gemma3:1b")
+def endpoint_label(scope) -> str:
+    """Route path template of a request (e.g. "/nearest/k"), so metric labels stay bounded"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return route.path
+    return "unmatched"
+
+class RequestMetricsMiddleware:
+    """Per-endpoint latency histogram and in-flight gauge (plain ASGI, so responses are not buffered)"""
     
-    # Clean database first to ensure fresh start
-    if bot.clean_database(confirm=False):
-        print("🧹 Database cleaned successfully")
+    def __init__(self, app):
+        self.app = app
     
-    # Load CSV data using the same workflow as chatbot.py
-    csv_files = ["bunker.csv", "embassies.csv", "bunkers.csv", "heat.csv"]
-    if bot.load_csv_data(csv_files) and bot.setup_vectorstore() and bot.setup_qa_chain():
-        print("✅ Bot initialized successfully!")
-    else:
-        print("❌ Bot initialization failed!")
-        bot = None
-except Exception as e:
-    print(f"❌ Error initializing bot: {e}")
-    bot = None
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        endpoint = endpoint_label(scope)
+        started = time.perf_counter()
+        responded = False
+        
+        def record(status: int):
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint,
+                                         method=scope["method"], status=str(status))
+        
+        async def send_and_record(message):
+            nonlocal responded
+            if message["type"] == "http.response.start":
+                responded = True
+                record(message["status"])
+            await send(message)
+        
+        HTTP_IN_FLIGHT.inc(endpoint=endpoint)
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            HTTP_IN_FLIGHT.dec(endpoint=endpoint)
+            if not responded:
+                record(500)
+
+app.add_middleware(RequestMetricsMiddleware)
+
+def collect_service_metrics():
+    """Gauges and counters read from the bot's caches, router and LLM queue at scrape time"""
+    yield ("safety_bot_ready", "gauge", "Whether each part of the bot is ready (1) or not (0)",
+           [({"part": "data"}, int(readiness["data_ready"])), ({"part": "rag"}, int(readiness["rag_ready"]))])
+    yield ("safety_bot_llm_calls_in_flight", "gauge", "LLM calls holding a concurrency slot",
+           [({}, llm_active)])
+    yield ("safety_bot_llm_calls_waiting", "gauge", "LLM calls queued for a concurrency slot",
+           [({}, llm_waiting)])
+    if readiness["data_ready"]:
+        yield ("safety_bot_location_records", "gauge", "Location rows currently loaded", [({}, len(bot.store))])
+    
+    answers = bot.answer_cache.stats()
+    yield ("safety_bot_answer_cache_lookups_total", "counter", "Answer cache lookups by result",
+           [({"result": "exact_hit"}, answers["exact_hits"]), ({"result": "semantic_hit"}, answers["semantic_hits"]),
+            ({"result": "miss"}, answers["misses"])])
+    yield ("safety_bot_answer_cache_entries", "gauge", "Cached answers", [({}, answers["entries"])])
+    yield ("safety_bot_answer_cache_invalidations_total", "counter", "Answer cache invalidations",
+           [({}, answers["invalidations"])])
+    
+    coalescing = inflight_answers.stats()
+    yield ("safety_bot_rag_questions_total", "counter", "RAG questions run, or coalesced into an identical one",
+           [({"outcome": "executed"}, coalescing["executions"]), ({"outcome": "coalesced"}, coalescing["deduplicated"])])
+    yield ("safety_bot_rag_questions_in_flight", "gauge", "Distinct RAG questions being answered",
+           [({}, coalescing["in_flight"])])
+    
+    if bot.embedding_cache is not None:
+        embeddings = bot.embedding_cache.stats()
+        yield ("safety_bot_embedding_cache_lookups_total", "counter", "Embedding cache lookups by result",
+               [({"result": "hit"}, embeddings["hits"]), ({"result": "miss"}, embeddings["misses"])])
+        yield ("safety_bot_embedding_cache_entries", "gauge", "Cached embeddings", [({}, embeddings["entries"])])
+    
+    yield ("safety_bot_routed_questions_total", "counter", "Questions answered per route",
+           [({"route": route}, s["count"]) for route, s in bot.intent_router.stats().items()])
+
+REGISTRY.add_collector(collect_service_metrics)
 
 class Query(BaseModel):
     question: str
+    user_lat: Optional[float] = None
+    user_lon: Optional[float] = None
 
 class LocationQuery(BaseModel):
     question: str
     user_lat: float = None
     user_lon: float = None
+    safety_type: Optional[str] = None
+
+class NearestKQuery(BaseModel):
+    user_lat: float
+    user_lon: float
+    k: int = Field(5, ge=1, le=100)
+    types: Optional[List[str]] = None
+    max_distance_km: Optional[float] = Field(None, gt=0)
+    avoid_danger_km: Optional[float] = Field(None, gt=0)
+
+class Coordinate(BaseModel):
+    lat: float
+    lon: float
+
+class BatchLocationQuery(BaseModel):
+    points: List[Coordinate] = Field(..., min_length=1, max_length=100_000)
+    safety_type: Optional[str] = None
+
+class WithinQuery(BaseModel):
+    user_lat: float
+    user_lon: float
+    radius_km: float = Field(..., gt=0, le=500)
+    types: Optional[List[str]] = None
+    avoid_danger_km: Optional[float] = Field(None, gt=0)
 
 @app.get("/")
 async def root():
     return {
         "message": "Israel Emergency Safety Bot API is running", 
-        "status": "ready" if bot else "error",
-        "data_sources": ["bunker.csv", "embassies.csv", "bunkers.csv", "heat.csv"] if bot else [],
-        "total_records": len(bot.df) if bot and bot.df is not None else 0
+        "status": readiness["state"],
+        "data_sources": CSV_FILES if readiness["data_ready"] else [],
+        "total_records": len(bot.store) if readiness["data_ready"] else 0
     }
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once questions can be answered, 503 while starting or after a failure"""
+    status_code = 200 if readiness["rag_ready"] else 503
+    return JSONResponse(status_code=status_code, content=readiness)
+
 @app.post("/ask")
 async def ask_question(query: Query):
-    if not bot:
-        raise HTTPException(status_code=500, detail="Bot is not initialized")
+    require_data()
     
     try:
-        print(f"📝 Received question: {query.question}")
+        log.info(f"📝 Received question: {query.question}")
         
         # Use the same emergency response method as chatbot.py
-        response = bot.get_emergency_response(query.question)
+        # Structured questions are answered from the data without taking an LLM slot
+        response = bot.route_question(query.question, query.user_lat, query.user_lon, use_embeddings=False)
+        if response is None:
+            require_rag()
+            response = await inflight_answers.do(
+                bot.question_key(query.question, query.user_lat, query.user_lon),
+                lambda: run_llm_call(bot.get_emergency_response, query.question, query.user_lat, query.user_lon, False)
+            )
         
-        print(f"✅ Generated response: {response[:100]}...")
+        log.info(f"✅ Generated response: {response[:100]}...")
         return {"response": response}
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error processing question: {e}")
+        log.error(f"❌ Error processing question: {e}")
         # Return emergency fallback response like chatbot.py
         fallback_response = (f"❌ Emergency system error: {e}\n\n"
                            "🚨 IMMEDIATE ACTION: Call emergency services 100 (Police), 101 (Medical)")
         return {"response": fallback_response}
 
+@app.post("/ask/stream")
+async def ask_question_stream(query: Query):
+    """Stream the answer as Server-Sent Events: a "locations" event right after retrieval,
+    then one "token" event per generated chunk, then "done" (or "error")."""
+    require_data()
+    
+    log.info(f"📝 Received streaming question: {query.question}")
+    
+    # Routed and cached answers are sent without taking an LLM slot, as in /ask
+    response = bot.route_question(query.question, query.user_lat, query.user_lon, use_embeddings=False)
+    if response is not None:
+        events = bot._answer_events(response)
+    else:
+        require_rag()
+        embed = bot._question_embedder(query.question)
+        events = await asyncio.get_running_loop().run_in_executor(
+            None, bot.stream_without_llm, query.question, query.user_lat, query.user_lon, embed
+        )
+        if events is None and llm_waiting >= LLM_MAX_QUEUE:
+            raise HTTPException(status_code=503, detail="Too many questions in progress, please retry shortly")
+    
+    async def sse_events():
+        if events is not None:
+            for event in events:
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+            return
+        
+        loop = asyncio.get_running_loop()
+        async with llm_slot():
+            generated = bot.stream_generated_response(query.question, query.user_lat, query.user_lon, embed)
+            # Each step of the blocking generator runs on the LLM thread pool
+            while (event := await loop.run_in_executor(llm_executor, next, generated, None)) is not None:
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+    
+    return StreamingResponse(sse_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/nearest")
 async def find_nearest_location(query: LocationQuery):
-    if not bot:
-        raise HTTPException(status_code=500, detail="Bot is not initialized")
+    require_data()
     
     try:
-        print(f"📍 Finding nearest location for: {query.question}")
+        log.info(f"📍 Finding nearest location for: {query.question}")
         
         if query.user_lat is None or query.user_lon is None:
             return {"response": "Please provide your coordinates (latitude and longitude) to find the nearest safety location."}
         
         # Find nearest safety location using chatbot method
-        nearest = bot.find_nearest_safety_location(query.user_lat, query.user_lon)
+        nearest = bot.find_nearest_safety_location(query.user_lat, query.user_lon, query.safety_type)
         if nearest:
             response = f"""*Nearest Safety Location:*
 
@@ -103,108 +544,251 @@ Police: 100 | Medical: 101 | Fire: 102"""
         
         return {"response": response}
     except Exception as e:
-        print(f"❌ Error finding nearest location: {e}")
+        log.error(f"❌ Error finding nearest location: {e}")
         fallback_response = (f"❌ Error finding location: {e}\n\n"
                            "🚨 IMMEDIATE ACTION: Call emergency services 100 (Police), 101 (Medical)")
         return {"response": fallback_response}
 
+@app.post("/nearest/k")
+async def find_k_nearest_locations(query: NearestKQuery):
+    require_data()
+    
+    results = bot.find_k_nearest_safety_locations(
+        query.user_lat, query.user_lon, k=query.k, safety_types=query.types,
+        max_distance_km=query.max_distance_km, avoid_danger_km=query.avoid_danger_km
+    )
+    return {"count": len(results), "results": results}
+
+@app.post("/nearest/batch")
+async def find_nearest_locations_batch(query: BatchLocationQuery):
+    require_data()
+    
+    lats = [point.lat for point in query.points]
+    lons = [point.lon for point in query.points]
+    
+    if len(lats) <= BATCH_JSON_MAX_POINTS:
+        results = await asyncio.get_running_loop().run_in_executor(
+            None, bot.find_nearest_safety_locations_batch, lats, lons, query.safety_type
+        )
+        return {"count": len(results), "results": results}
+    
+    def ndjson_lines():
+        for start in range(0, len(lats), BATCH_STREAM_CHUNK):
+            results = bot.find_nearest_safety_locations_batch(
+                lats[start:start + BATCH_STREAM_CHUNK], lons[start:start + BATCH_STREAM_CHUNK], query.safety_type
+            )
+            yield "".join(json.dumps({"index": start + i, "nearest": nearest}) + "\n"
+                          for i, nearest in enumerate(results))
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+@app.post("/within")
+async def find_locations_within(query: WithinQuery):
+    require_data()
+    
+    results = bot.find_locations_within(
+        query.user_lat, query.user_lon, query.radius_km,
+        location_types=query.types, avoid_danger_km=query.avoid_danger_km
+    )
+    return {"count": len(results), "results": results}
+
 @app.get("/emergency")
 async def emergency_help():
-    if not bot:
-        raise HTTPException(status_code=500, detail="Bot is not initialized")
-    
     # Return the same emergency help as chatbot.py
     help_response = bot._handle_emergency_command()
     return {"response": help_response}
 
-@app.get("/stats")
-async def get_stats():
-    if not bot or bot.df is None:
-        raise HTTPException(status_code=500, detail="Bot is not initialized")
+def not_modified(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already names this ETag"""
+    header = request.headers.get("if-none-match", "")
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return f'"{etag}"' in tags or "*" in tags
+
+def cached_json(request: Request, etag: str, build) -> Response:
+    """JSON response tagged with an ETag, or an empty 304 when the client's copy is current"""
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=build(), headers=headers)
+
+def map_layer_response(request: Request, south: float, west: float, north: float, east: float,
+                       types: Optional[str], zoom: Optional[int]) -> Response:
+    """GeoJSON of the locations in a box, gzip-compressed when accepted and tagged with an ETag"""
+    store = bot.store
+    if types:
+        location_types = sorted({t for name in types.split(",") for t in LAYER_GROUPS.get(name.strip(), [name.strip()])})
+    else:
+        location_types = sorted(store.indexes)
+    query = json.dumps([round(south, 6), round(west, 6), round(north, 6), round(east, 6), location_types, zoom])
+    etag = f"{store.etag}-{hashlib.sha1(query.encode('utf-8')).hexdigest()[:12]}"
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    bodies = map_layer_cache.get(etag)
+    if bodies is None:
+        body = json.dumps(layer_features(store, south, west, north, east, location_types, zoom),
+                          separators=(",", ":")).encode("utf-8")
+        bodies = (body, gzip.compress(body, compresslevel=6))
+        map_layer_cache[etag] = bodies
+        if len(map_layer_cache) > MAP_CACHE_ENTRIES:
+            map_layer_cache.popitem(last=False)
+    else:
+        map_layer_cache.move_to_end(etag)
+    
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(content=bodies[1], media_type="application/geo+json",
+                        headers={**headers, "Content-Encoding": "gzip"})
+    return Response(content=bodies[0], media_type="application/geo+json", headers=headers)
+
+@app.get("/map/bbox")
+async def map_bbox(request: Request, bbox: str, types: Optional[str] = None, zoom: Optional[int] = None):
+    """Locations inside bbox=west,south,east,north (degrees), clustered below zoom 14.
+    types is a comma-separated list of location types or the groups "safety" and "danger"."""
+    require_data()
     
     try:
-        stats = {
-            "total_records": len(bot.df),
-            "data_types": bot.df['type'].value_counts().to_dict(),
-            "sources": bot.df['source_file'].value_counts().to_dict() if 'source_file' in bot.df.columns else {},
-            "cities": bot.df['city'].value_counts().to_dict()[:10]  # Top 10 cities
-        }
-        return stats
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error getting stats: {str(e)}")
+        west, south, east, north = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be west,south,east,north in degrees")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise HTTPException(status_code=400, detail="bbox is outside the valid latitude/longitude range")
+    if zoom is not None and not 0 <= zoom <= MAX_ZOOM:
+        raise HTTPException(status_code=400, detail=f"zoom must be between 0 and {MAX_ZOOM}")
+    return map_layer_response(request, south, west, north, east, types, zoom)
+
+@app.get("/map/tiles/{z}/{x}/{y}.geojson")
+async def map_tile(request: Request, z: int, x: int, y: int, types: Optional[str] = None):
+    """Locations inside one Web Mercator z/x/y tile, clustered below zoom 14"""
+    require_data()
+    
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="No such tile")
+    return map_layer_response(request, *tile_bounds(z, x, y), types, z)
+
+@app.get("/stats")
+async def get_stats(request: Request):
+    require_data()
+    
+    # Served from the summary computed when the data was loaded
+    store = bot.store
+    summary = store.summary
+    return cached_json(request, store.summary_etag, lambda: {
+        "total_records": summary["total_records"],
+        "data_types": summary["data_types"],
+        "sources": summary["sources"],
+        "cities": summary["top_cities"]  # Top 10 cities
+    })
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return {
+        "answers": bot.answer_cache.stats(),
+        "coalescing": inflight_answers.stats(),
+        "embeddings": bot.embedding_cache.stats() if bot.embedding_cache else {}
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text-format metrics: stage and endpoint latency histograms, gauges and cache counters"""
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/router/stats")
+async def get_router_stats():
+    return bot.intent_router.stats()
+
+@app.post("/admin/reload")
+async def reload_data(x_admin_token: Optional[str] = Header(None)):
+    """Re-read changed CSV files now instead of waiting for the watcher"""
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    require_data()
+    
+    result = await asyncio.get_running_loop().run_in_executor(None, reload_data_files)
+    log.info(f"🔄 Reload requested: {len(result.get('changed', []))} files changed")
+    return result
+
+def render_mix_report(summary: dict, generated: float) -> str:
+    """Render the mixed safety data report from a store summary"""
+    total_records = summary["total_records"]
+    data_types = summary["data_types"]
+    lat_range = f"{summary['lat_range'][0]:.4f} to {summary['lat_range'][1]:.4f}"
+    lon_range = f"{summary['lon_range'][0]:.4f} to {summary['lon_range'][1]:.4f}"
+    
+    lines = [
+        "*COMPREHENSIVE SAFETY DATA REPORT*",
+        f"Generated: {pd.Timestamp.fromtimestamp(generated).strftime('%Y-%m-%d %H:%M:%S')}",
+        "",
+        "*OVERVIEW STATISTICS:*",
+        f"- Total Safety Locations: {total_records}",
+        f"- Data Sources: {len(summary['sources'])}",
+        f"- Cities Covered: {summary['city_count']}",
+        f"- Geographic Coverage: Lat {lat_range}, Lon {lon_range}",
+        "",
+        "*SAFETY FACILITY BREAKDOWN:*"
+    ]
+    
+    # Add type breakdown
+    for facility_type, count in data_types.items():
+        lines.append(f"- {facility_type.upper()}: {count} locations ({(count / total_records) * 100:.1f}%)")
+    lines += ["", "*DATA SOURCE ANALYSIS:*"]
+    for source, count in summary["sources"].items():
+        lines.append(f"- {source}: {count} records ({(count / total_records) * 100:.1f}%)")
+    
+    # Top 10 cities
+    lines += ["", "*TOP 10 CITIES BY SAFETY LOCATIONS:*"]
+    for i, (city, count) in enumerate(summary["top_cities"].items(), 1):
+        lines.append(f"{i}. {city}: {count} locations")
+    
+    # Coverage analysis
+    bunkers = data_types.get('bunker', 0) + data_types.get('shelter', 0)
+    embassies = data_types.get('embassy', 0)
+    heat_zones = data_types.get('heat', 0)
+    lines += [
+        "",
+        "*SAFETY COVERAGE ANALYSIS:*",
+        f"- Protective Facilities: {bunkers} ({((bunkers/total_records)*100):.1f}%)",
+        f"- Diplomatic Support: {embassies} ({((embassies/total_records)*100):.1f}%)",
+        f"- Heat Risk Zones: {heat_zones} ({((heat_zones/total_records)*100):.1f}%)"
+    ]
+    
+    # Emergency recommendations
+    lines += [
+        "",
+        "*EMERGENCY PREPAREDNESS:*",
+        "- Know your nearest bunker/shelter location",
+        "- Keep emergency contacts ready: Police 100, Medical 101, Fire 102",
+        "- Stay informed via Home Front Command alerts",
+        "- Maintain emergency supplies (water, food, first aid)"
+    ]
+    
+    # Data quality indicators
+    if summary["missing_cities"] > 0:
+        lines += ["", "*DATA QUALITY NOTES:*", f"- {summary['missing_cities']} records missing city information"]
+    
+    return "\n".join(lines)
+
+# The rendered report of the current data snapshot, keyed by the store's ETag
+mix_report_cache = {"etag": None, "report": None}
 
 @app.get("/mix-report")
-async def get_mix_report():
+async def get_mix_report(request: Request):
     """Generate a comprehensive mixed report of all safety data"""
-    if not bot or bot.df is None:
-        raise HTTPException(status_code=500, detail="Bot is not initialized")
+    require_data()
     
     try:
-        # Generate comprehensive statistics
-        total_records = len(bot.df)
-        data_types = bot.df['type'].value_counts().to_dict()
-        sources = bot.df['source_file'].value_counts().to_dict() if 'source_file' in bot.df.columns else {}
-        cities = bot.df['city'].value_counts().to_dict()
-        
-        # Calculate geographic distribution
-        lat_range = f"{bot.df['lat'].min():.4f} to {bot.df['lat'].max():.4f}"
-        lon_range = f"{bot.df['lon'].min():.4f} to {bot.df['lon'].max():.4f}"
-          # Generate the mixed report
-        report = f"""*COMPREHENSIVE SAFETY DATA REPORT*
-Generated: {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-*OVERVIEW STATISTICS:*
-- Total Safety Locations: {total_records}
-- Data Sources: {len(sources)}
-- Cities Covered: {len(cities)}
-- Geographic Coverage: Lat {lat_range}, Lon {lon_range}
-
-*SAFETY FACILITY BREAKDOWN:*"""
-        
-        # Add type breakdown
-        for facility_type, count in data_types.items():
-            percentage = (count / total_records) * 100
-            report += f"\n- {facility_type.upper()}: {count} locations ({percentage:.1f}%)"
-        report += f"\n\n*DATA SOURCE ANALYSIS:*"
-        for source, count in sources.items():
-            percentage = (count / total_records) * 100
-            report += f"\n- {source}: {count} records ({percentage:.1f}%)"
-        
-        # Top 10 cities
-        report += f"\n\n*TOP 10 CITIES BY SAFETY LOCATIONS:*"
-        top_cities = list(cities.items())[:10]
-        for i, (city, count) in enumerate(top_cities, 1):
-            report += f"\n{i}. {city}: {count} locations"
-        
-        # Coverage analysis
-        bunkers = data_types.get('bunker', 0) + data_types.get('shelter', 0)
-        embassies = data_types.get('embassy', 0)
-        heat_zones = data_types.get('heat', 0)
-        
-        report += f"\n\n*SAFETY COVERAGE ANALYSIS:*"
-        report += f"\n- Protective Facilities: {bunkers} ({((bunkers/total_records)*100):.1f}%)"
-        report += f"\n- Diplomatic Support: {embassies} ({((embassies/total_records)*100):.1f}%)"
-        report += f"\n- Heat Risk Zones: {heat_zones} ({((heat_zones/total_records)*100):.1f}%)"
-        
-        # Emergency recommendations
-        report += f"\n\n*EMERGENCY PREPAREDNESS:*"
-        report += f"\n- Know your nearest bunker/shelter location"
-        report += f"\n- Keep emergency contacts ready: Police 100, Medical 101, Fire 102"
-        report += f"\n- Stay informed via Home Front Command alerts"
-        report += f"\n- Maintain emergency supplies (water, food, first aid)"
-        
-        # Data quality indicators
-        missing_cities = bot.df['city'].isna().sum()
-        if missing_cities > 0:
-            report += f"\n\n*DATA QUALITY NOTES:*"
-            report += f"\n- {missing_cities} records missing city information"
-        
-        return {"response": report}
+        store = bot.store
+        if mix_report_cache["etag"] != store.etag:
+            # Rendered once per data snapshot; "Generated" is when that data was loaded
+            mix_report_cache.update(etag=store.etag, report=render_mix_report(store.summary, store.created))
+        report = mix_report_cache["report"]
+        return cached_json(request, store.etag, lambda: {"response": report})
         
     except Exception as e:
-        print(f"❌ Error generating mix report: {e}")
+        log.error(f"❌ Error generating mix report: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating report: {str(e)}")
 
 if __name__ == "__main__":
-    print("🚀 Starting Israel Emergency Safety Bot API on http://localhost:8000")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    log.info("🚀 Starting Israel Emergency Safety Bot API on http://localhost:8000")
+    # Several workers need the app as an import string so each process can load it
+    uvicorn.run("api_server:app" if WORKERS > 1 else app, host="0.0.0.0", port=8000, workers=WORKERS)
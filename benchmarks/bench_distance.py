@@ -0,0 +1,59 @@
+"""Compare the scalar calculate_distance path with the vectorized haversine kernel.
+
+Usage: python benchmarks/bench_distance.py [--rows 100000] [--points 1000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot import IsraelSafetyRAGBot  # noqa: E402
+from spatial import CoordinateArrays, GeoIndex  # noqa: E402
+
+
+def timed(fn, repeat: int = 5) -> float:
+    """Best wall time of fn() in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--points", type=int, default=1_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lats = rng.uniform(29.5, 33.3, args.rows)
+    lons = rng.uniform(34.3, 35.9, args.rows)
+    user_lats = rng.uniform(29.5, 33.3, args.points)
+    user_lons = rng.uniform(34.3, 35.9, args.points)
+
+    bot = IsraelSafetyRAGBot()
+    coords = CoordinateArrays(lats, lons)
+    index = GeoIndex(lats, lons)
+
+    scalar_ms = timed(lambda: [bot.calculate_distance(32.08, 34.78, a, o) for a, o in zip(lats, lons)], repeat=1)
+    vector_ms = timed(lambda: coords.distances_from(32.08, 34.78))
+    chunk = max(1, 4_000_000 // args.rows)
+    batch_ms = timed(lambda: [coords.distances_from(user_lats[i:i + chunk], user_lons[i:i + chunk]).argmin(axis=1)
+                              for i in range(0, args.points, chunk)], repeat=1)
+    index_ms = timed(lambda: [index.query_nearest(a, o) for a, o in zip(user_lats, user_lons)], repeat=1)
+
+    print(f"rows={args.rows} points={args.points}")
+    print(f"{'scalar calculate_distance, 1 point -> all rows':<48} {scalar_ms:10.2f} ms")
+    print(f"{'vectorized kernel, 1 point -> all rows':<48} {vector_ms:10.2f} ms ({scalar_ms / vector_ms:.0f}x)")
+    print(f"{f'vectorized batch, {args.points} points -> nearest':<48} {batch_ms:10.2f} ms")
+    print(f"{f'GeoIndex, {args.points} points -> nearest':<48} {index_ms:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
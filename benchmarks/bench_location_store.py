@@ -0,0 +1,98 @@
+"""Compare memory of the raw object-dtype location table with the compact LocationStore.
+
+Usage: python benchmarks/bench_location_store.py [--rows 1000000] [--cities 5000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from location_store import LocationStore, compact_frame  # noqa: E402
+from spatial import CoordinateArrays, GeoIndex  # noqa: E402
+
+TYPES = ['bunker', 'shelter', 'embassy', 'heat', 'shooting', 'bomb']
+SOURCES = ['bunker.csv', 'bunkers.csv', 'embassies.csv', 'heat.csv']
+
+
+def synthetic_frame(rows: int, cities: int, seed: int = 0) -> pd.DataFrame:
+    """Rows shaped like the concatenated CSV frames (object-dtype string columns)"""
+    rng = np.random.default_rng(seed)
+    city_names = np.array([f"City {i}" for i in range(cities)], dtype=object)
+    return pd.DataFrame({
+        'type': np.array(TYPES, dtype=object)[rng.integers(0, len(TYPES), rows)],
+        'lat': rng.uniform(29.5, 33.3, rows),
+        'lon': rng.uniform(34.3, 35.9, rows),
+        'city': city_names[rng.integers(0, cities, rows)],
+        'source_file': np.array(SOURCES, dtype=object)[rng.integers(0, len(SOURCES), rows)]
+    })
+
+
+def index_bytes(index: GeoIndex) -> int:
+    coords = index.coords
+    return (sum(getattr(coords, name).nbytes for name in ("lat", "lon", "lat_rad", "lon_rad", "cos_lat"))
+            + index.ids.nbytes + index.band_keys.nbytes + index.band_starts.nbytes + index.band_ends.nbytes)
+
+
+def timed(fn, repeat: int = 5) -> float:
+    """Best wall time of fn() in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--cities", type=int, default=5_000)
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.rows, args.cities)
+
+    # Before: object-dtype frame (deep size counts one string per cell, as read_csv produces),
+    # a coordinate copy for distances, and per-type indexes that copy the coordinates again
+    lats = df['lat'].to_numpy()
+    lons = df['lon'].to_numpy()
+    start = time.perf_counter()
+    coordinates = CoordinateArrays(lats, lons)
+    indexes = {t: GeoIndex(lats[rows], lons[rows], ids=rows)
+               for t, rows in df.groupby('type', sort=False).indices.items()}
+    before_build = time.perf_counter() - start
+    before = {
+        "frame": int(df.memory_usage(deep=True).sum()),
+        "coordinates": sum(getattr(coordinates, name).nbytes for name in ("lat", "lon", "lat_rad", "lon_rad", "cos_lat")),
+        "indexes": sum(index_bytes(index) for index in indexes.values())
+    }
+
+    start = time.perf_counter()
+    store = LocationStore.from_frames([compact_frame(df)])
+    after_build = time.perf_counter() - start
+    after = store.memory_usage()
+
+    mask_ms = timed(lambda: np.flatnonzero(df['type'].isin(['bunker', 'shelter']).to_numpy()))
+    slice_ms = timed(lambda: [store.rows_of_type(t) for t in ('bunker', 'shelter')])
+
+    before_total, after_total = sum(before.values()), sum(after.values())
+    print(f"rows={args.rows} cities={args.cities}")
+    for name, size in before.items():
+        print(f"{'before: ' + name:<28} {size / 1e6:10.1f} MB")
+    print(f"{'before: total':<28} {before_total / 1e6:10.1f} MB ({before_total / args.rows:.0f} B/row, "
+          f"index build {before_build:.2f}s)")
+    for name, size in after.items():
+        print(f"{'after: ' + name:<28} {size / 1e6:10.1f} MB")
+    print(f"{'after: total':<28} {after_total / 1e6:10.1f} MB ({after_total / args.rows:.0f} B/row, "
+          f"store build {after_build:.2f}s)")
+    print(f"{'memory reduction':<28} {before_total / after_total:10.1f}x")
+    print(f"{'type filter: object mask':<28} {mask_ms:10.3f} ms")
+    print(f"{'type filter: row range':<28} {slice_ms:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""End-to-end benchmark of the bot and API server with stand-in embedding and chat models.
+
+No Ollama server is needed: deterministic fake models with a fixed latency replace the
+Ollama embeddings and chat model, and the CSV files are synthesized from the shipped ones
+(same type,lat,lon,city schema and per-file type mix) at any size. Measures cold and warm
+load time, embedding/ingest throughput, /nearest and /ask latency under concurrent load and
+memory, and writes the results as JSON; --compare prints the change against an earlier run.
+
+Usage: python benchmarks/bench_offline.py [--rows 20000] [--embed-dim 384] [--embed-latency-ms 5]
+           [--llm-latency-ms 200] [--concurrency 8] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from langchain_core.embeddings import Embeddings  # noqa: E402
+from langchain_core.language_models.chat_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatResult  # noqa: E402
+
+SHIPPED_CSV_FILES = ["bunker.csv", "embassies.csv", "bunkers.csv", "heat.csv"]
+
+# Open-ended questions that the intent router leaves to the RAG chain, so each /ask reaches the chat model
+QUESTIONS = [
+    "What is the safest way to get around {city} at night?",
+    "Is it safe to travel around {city} today?",
+    "How do I prepare my family for an emergency in {city}?",
+    "What are the risks of staying outside during a heat wave in {city}?",
+    "Who should I contact for help as a tourist in {city}?"
+]
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic unit vectors derived from a hash of the text, after a fixed delay per call"""
+
+    def __init__(self, dimension: int = 384, latency: float = 0.005):
+        self.dimension = dimension
+        self.latency = latency
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers with a fixed text after a fixed delay"""
+
+    latency: float = 0.2
+    answer: str = "- Go to the nearest shelter and stay inside until the all-clear.\n- Call 100 (Police)."
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+
+def synthetic_csv_files(directory: str, rows: int, seed: int = 0) -> List[str]:
+    """Write len(SHIPPED_CSV_FILES) files totalling about `rows` rows, scaled from the shipped ones.
+
+    Each file keeps its shipped share of rows and type mix; rows are shipped locations moved by
+    a few kilometres, with numbered variants of the shipped city names.
+    """
+    rng = np.random.default_rng(seed)
+    shipped = {name: pd.read_csv(os.path.join(ROOT, name)) for name in SHIPPED_CSV_FILES}
+    shipped_rows = sum(len(df) for df in shipped.values())
+    paths = []
+    for name, df in shipped.items():
+        count = max(1, round(rows * len(df) / shipped_rows))
+        picks = rng.integers(0, len(df), count)
+        pd.DataFrame({
+            'type': df['type'].to_numpy()[picks],
+            'lat': np.round(np.clip(df['lat'].to_numpy()[picks] + rng.normal(0, 0.05, count), 29.5, 33.3), 6),
+            'lon': np.round(np.clip(df['lon'].to_numpy()[picks] + rng.normal(0, 0.05, count), 34.3, 35.9), 6),
+            'city': [f"{city} {number}" for city, number in zip(df['city'].to_numpy()[picks],
+                                                                  rng.integers(1, 200, count))]
+        }).to_csv(os.path.join(directory, name), index=False)
+        paths.append(os.path.join(directory, name))
+    return paths
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    scale = 1 if platform.system() == "Darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6, 1)
+
+
+def latency_stats(latencies: List[float], wall: float) -> Dict:
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+        "requests_per_second": round(len(latencies) / wall, 1)
+    }
+
+
+def run_load(client: httpx.Client, path: str, payloads: List[Dict], concurrency: int) -> Dict:
+    """POST every payload with `concurrency` clients in parallel; latency percentiles and throughput"""
+    def post(payload):
+        started = time.perf_counter()
+        response = client.post(path, json=payload)
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(post, payloads))
+    return {"concurrency": concurrency, **latency_stats(latencies, time.perf_counter() - started)}
+
+
+def start_server(app) -> tuple:
+    """Serve the app on a free local port in a background thread; returns (server, base_url)"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    # Startup is driven by the benchmark itself, so the app's lifespan is not run
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="off", log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def run(args, workdir: str) -> Dict:
+    os.environ["LLM_CONCURRENCY"] = str(args.llm_concurrency)
+    os.environ["LLM_MAX_QUEUE"] = str(max(32, args.ask_requests))
+    os.environ["CSV_WATCH_INTERVAL"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "INFO" if args.verbose else "WARNING")
+
+    # Swap the Ollama models for the fakes before the bot imports them
+    import langchain_ollama
+    langchain_ollama.OllamaEmbeddings = lambda **kwargs: FakeEmbeddings(args.embed_dim, args.embed_latency_ms / 1000)
+    langchain_ollama.ChatOllama = lambda **kwargs: FakeChatModel(latency=args.llm_latency_ms / 1000)
+
+    import api_server
+    from chatbot import IsraelSafetyRAGBot
+    from intent_router import RAG, IntentRouter
+
+    routed = [q for q in QUESTIONS if IntentRouter().classify(q.format(city="Haifa"), use_embeddings=False)[0] != RAG]
+    if routed:
+        raise RuntimeError(f"Questions answered without the chat model would skew /ask latency: {routed}")
+
+    csv_files = synthetic_csv_files(workdir, args.rows, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    results = {"config": {**vars(args), "python": platform.python_version(), "created": time.time()}}
+
+    def new_bot() -> IsraelSafetyRAGBot:
+        bot = IsraelSafetyRAGBot(model_name="fake")
+        bot.db_path = os.path.join(workdir, "chroma_db")
+        bot.embedding_cache_path = os.path.join(workdir, "embedding_cache.sqlite3")
+        bot.snapshot_path = os.path.join(workdir, "location_snapshot")
+        return bot
+
+    started = time.perf_counter()
+    new_bot().load_csv_data(csv_files)
+    cold = time.perf_counter() - started
+
+    # The server's startup path: warm load from the snapshot, then the vector store and QA chain
+    api_server.bot = new_bot()
+    api_server.CSV_FILES = csv_files
+    # Kept in workdir, so a server running in the caller's directory is neither touched nor joined
+    api_server.BUILDER_LOCK = os.path.join(workdir, ".bot_builder.lock")
+    api_server.BUILD_STATE = os.path.join(workdir, ".bot_build.json")
+    api_server.initialize_bot()
+    if api_server.readiness["state"] != "ready":
+        raise RuntimeError(f"Bot initialization failed: {api_server.readiness['error']}")
+    bot = api_server.bot
+    results["load"] = {
+        "records": len(bot.store),
+        "cold_seconds": round(cold, 3),
+        "warm_seconds": api_server.readiness["timings"]["data_seconds"]
+    }
+    results["ingest"] = bot.ingest_stats
+    results["memory"] = {
+        "store_mb": round(sum(bot.store.memory_usage().values()) / 1e6, 1),
+        "peak_rss_after_startup_mb": peak_rss_mb()
+    }
+
+    server, base_url = start_server(api_server.app)
+    try:
+        with httpx.Client(base_url=base_url, timeout=300,
+                          limits=httpx.Limits(max_connections=args.concurrency * 2)) as client:
+            lats = rng.uniform(29.5, 33.3, args.nearest_requests)
+            lons = rng.uniform(34.3, 35.9, args.nearest_requests)
+            results["nearest"] = run_load(client, "/nearest", [
+                {"question": "nearest shelter", "user_lat": lat, "user_lon": lon}
+                for lat, lon in zip(lats.tolist(), lons.tolist())
+            ], args.concurrency)
+
+            # Distinct questions, so every request misses the answer cache and reaches the chat model
+            cities = bot.store.city_names[:-1]
+            results["ask"] = run_load(client, "/ask", [
+                {"question": QUESTIONS[i % len(QUESTIONS)].format(city=cities[rng.integers(len(cities))]) + f" ({i})",
+                 "user_lat": float(rng.uniform(29.5, 33.3)), "user_lon": float(rng.uniform(34.3, 35.9))}
+                for i in range(args.ask_requests)
+            ], args.concurrency)
+            results["ask"]["llm_concurrency"] = args.llm_concurrency
+    finally:
+        server.should_exit = True
+
+    results["memory"]["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    values = {}
+    for key, value in results.items():
+        if key == "config":
+            continue
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+
+def compare(baseline: Dict, results: Dict):
+    """Print each metric next to the baseline value and the relative change"""
+    before, after = flatten(baseline), flatten(results)
+    for name, value in after.items():
+        if name in before:
+            old = before[name]
+            change = f"{(value - old) / old * 100:+.1f}%" if old else ""
+            print(f"{name:<40} {old:>12} -> {value:<12} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embed-dim", type=int, default=384)
+    parser.add_argument("--embed-latency-ms", type=float, default=5.0, help="delay per embedding call")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="delay per chat completion")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="LLM_CONCURRENCY of the server")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel HTTP clients")
+    parser.add_argument("--nearest-requests", type=int, default=2_000)
+    parser.add_argument("--ask-requests", type=int, default=64)
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show the bot and server logs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-offline-") as workdir:
+        logs = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with logs:
+            results = run(args, workdir)
+
+    text = json.dumps(results, indent=2, default=str)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,300 @@
+from __future__ import annotations
+
+import numpy as np
 import pandas as pd
-import chromadb
-from chromadb.config import Settings
-from langchain_ollama import OllamaEmbeddings, ChatOllama
-from langchain_community.vectorstores import Chroma
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import RetrievalQA
-from langchain_core.documents import Document
-from langchain_core.prompts import PromptTemplate
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from rich import print as rprint
 from rich.panel import Panel
 from rich.console import Console
 from rich.prompt import Prompt
 from rich.text import Text
+from spatial import EARTH_RADIUS_KM, CoordinateArrays, GeoIndex, haversine_km
+from location_store import LocationStore, compact_frame, location_keys, valid_rows
+from snapshot import load_snapshot, save_snapshot
+from metrics import logger, span
+from prompt_context import PROMPT_TOKENS, build_context, estimate_tokens
+from answer_cache import AnswerCache, SingleFlight, normalize_question
+from intent_router import CITY, EMERGENCY, NEAREST, RAG, IntentRouter
 import os
+import json
 import math
 import shutil
-from typing import List, Dict, Optional
+import hashlib
+import itertools
+import threading
+import time
+from string import Formatter
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Dict, Optional
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from embedding_cache import EmbeddingCache
 
 console = Console()
 
+COLLECTION_NAME = "israel_safety_data"
+# Ids/metadata read and deleted per call; Chroma's SQLite backend caps the variables per statement
+VECTORSTORE_PAGE_SIZE = 5000
+# Written to the database directory after each sync: the store ETag and embedding model the collection matches
+SYNC_STATE_NAME = "sync_state.json"
+
+# Rows rendered per block by create_documents_from_csv
+DOCUMENT_BLOCK_ROWS = 10_000
+
+CONTENT_TEMPLATES = {
+    'bunker': """
+            BUNKER - {city} ({lat}, {lon})
+            Maximum protection from rockets/explosions. Go here during alerts.
+            Source: {source}
+            """,
+    'shelter': """
+            SHELTER - {city} ({lat}, {lon})
+            Good protection during air raids. Stay until all-clear.
+            Source: {source}
+            """,
+    'embassy': """
+            EMBASSY - {city} ({lat}, {lon})
+            Safe diplomatic facility. Contact for citizen services and emergency assistance.
+            Source: {source}
+            """,
+    'heat': """
+            HEAT ZONE - {city} ({lat}, {lon})
+            High temperature area. Risk of heat-related health issues. Stay hydrated, seek shade.
+            Source: {source}
+            """,
+    'shooting': """
+            SHOOTING ALERT - {city} ({lat}, {lon})
+            AVOID AREA. Call 100 (Police). Very dangerous situation
+            Source: {source}
+            """,
+    'bomb': """
+            BOMB ALERT - {city} ({lat}, {lon})
+            EVACUATE 500m+. Call 100 (Police). Extremely dangerous situation
+            Source: {source}
+            """
+}
+
+DEFAULT_CONTENT_TEMPLATE = """
+        LOCATION - {city} ({lat}, {lon})
+        Type: {type} - Location information available
+        Source: {source}
+        """
+
+# Columns a CSV file must have; files without them are skipped
+REQUIRED_COLUMNS = ['lat', 'lon', 'type']
+
+SAFETY_TYPES = ['bunker', 'shelter']
+DANGER_TYPES = ['shooting', 'bomb']
+# Rounds of doubling the candidate count when nearest results are filtered for danger (k * 2**5 at most)
+DANGER_FILTER_MAX_ROUNDS = 6
+
+# Documents from a plain similarity search (no coordinates or type hints)
+RETRIEVER_K = 5
+
+# Geo-aware retrieval: candidates fetched from the vector store, documents kept after
+# re-ranking, weight of vector similarity vs. proximity, and smallest search radius
+HYBRID_FETCH_K = 20
+HYBRID_TOP_K = 3
+HYBRID_SIMILARITY_WEIGHT = 0.6
+HYBRID_MIN_RADIUS_KM = 1.0
+# Answers for located questions are cached and coalesced per grid cell of this size
+ANSWER_SCOPE_CELL_DEG = 0.05
+
+def _as_text(series: pd.Series) -> np.ndarray:
+    """Object array of str() of each value, matching f-string formatting (NaN -> 'nan')"""
+    return series.to_numpy(dtype=object).astype(str).astype(object)
+
+
 class IsraelSafetyRAGBot:
     def __init__(self, model_name: str = "llama2"):
         self.model_name = model_name
         self.embeddings = None
         self.vectorstore = None
-        self.qa_chain = None
-        self.df = None
+        self.llm = None
+        self.prompt = None
+        self.store: Optional[LocationStore] = None
+        self.csv_files: List[str] = []
+        self._csv_states: Dict[str, Optional[Dict]] = {}
+        # Rows per file dropped as duplicates of earlier files, from the last parse of each file
+        self._csv_duplicates: Dict[str, int] = {}
+        self.csv_chunk_rows = 100_000
+        self.snapshot_path = "./location_snapshot"
+        self._reload_lock = threading.Lock()
         self.db_path = "./chroma_db"
+        self.embedding_cache_path = "./embedding_cache.sqlite3"
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        self.embed_batch_size = 64
+        self.embed_workers = 4
+        self.embed_parallel = True
+        self.ingest_stats: Dict = {}
+        self.answer_cache = AnswerCache()
+        self.inflight_questions = SingleFlight()
+        self.intent_router = IntentRouter()
+        # Estimated tokens of retrieved location text allowed into each prompt
+        self.context_token_budget = 200
         
+    @property
+    def df(self) -> Optional[pd.DataFrame]:
+        """The combined location rows of the current store, as a DataFrame built on each access"""
+        return self.store.to_frame() if self.store is not None else None
+    
+    @property
+    def coordinates(self) -> Optional[CoordinateArrays]:
+        return self.store.coordinates if self.store is not None else None
+    
+    @property
+    def location_index(self) -> Dict[str, GeoIndex]:
+        return self.store.indexes if self.store is not None else {}
+    
+    @span("csv_read")
+    def _read_csv_file(self, csv_file: str) -> Optional[List[pd.DataFrame]]:
+        """Read one CSV file as chunks of compact, validated rows; None if it cannot be loaded.
+        
+        Only the location columns are parsed, with string columns read straight into categories,
+        so peak memory is the compact rows plus one raw chunk. Rows without a type or with missing
+        or out-of-range coordinates are dropped.
+        """
+        try:
+            # Map stripped column names to the raw header names the parser sees
+            raw_names = {}
+            for raw in pd.read_csv(csv_file, nrows=0).columns:
+                raw_names.setdefault(raw.strip(), raw)
+            
+            missing = [col for col in REQUIRED_COLUMNS if col not in raw_names]
+            if missing:
+                rprint(Panel(f"⚠️ Skipping {csv_file}: missing column(s) {', '.join(missing)}", style="yellow"))
+                return None
+            
+            # Use 'city' if exists, otherwise use 'name'
+            city_column = next((col for col in ('city', 'name') if col in raw_names), None)
+            columns = REQUIRED_COLUMNS + ([city_column] if city_column else [])
+            renames = {raw_names[col]: col for col in columns}
+            if city_column:
+                renames[raw_names[city_column]] = 'city'
+            dtypes = {raw_names[col]: 'category' for col in columns if col not in ('lat', 'lon')}
+            
+            chunks, records, dropped = [], 0, 0
+            for chunk in pd.read_csv(csv_file, usecols=list(renames), dtype=dtypes, chunksize=self.csv_chunk_rows):
+                chunk = chunk.rename(columns=renames)
+                if city_column is None:
+                    chunk['city'] = f"Location from {csv_file}"
+                # Add source file information
+                chunk['source_file'] = csv_file
+                chunk = compact_frame(chunk)
+                
+                valid = valid_rows(chunk)
+                if not valid.all():
+                    dropped += int((~valid).sum())
+                    chunk = chunk[valid]
+                records += len(chunk)
+                if len(chunk):
+                    chunks.append(chunk)
+            
+            rprint(Panel(f"✅ Loaded {csv_file}: {records} records"
+                         + (f" ({dropped} invalid rows skipped)" if dropped else ""), style="green"))
+            return chunks
+            
+        except FileNotFoundError:
+            rprint(Panel(f"⚠️ File not found: {csv_file} - skipping", style="yellow"))
+            return None
+        except Exception as file_error:
+            rprint(Panel(f"❌ Error loading {csv_file}: {file_error}", style="red"))
+            return None
+    
+    @staticmethod
+    @span("dedupe")
+    def _drop_known_locations(chunks: List[pd.DataFrame], seen: np.ndarray) -> tuple:
+        """Drop rows whose (type, lat, lon) an earlier file already provided; returns (chunks, seen, dropped).
+        
+        `seen` is the sorted array of location keys of the earlier files. Repeats within one file
+        are kept.
+        """
+        kept, keys, dropped = [], [], 0
+        for chunk in chunks:
+            chunk_keys = location_keys(chunk)
+            positions = np.minimum(np.searchsorted(seen, chunk_keys), max(len(seen) - 1, 0))
+            duplicate = seen[positions] == chunk_keys if len(seen) else np.zeros(len(chunk), dtype=bool)
+            if duplicate.any():
+                dropped += int(duplicate.sum())
+                chunk, chunk_keys = chunk[~duplicate], chunk_keys[~duplicate]
+            if len(chunk):
+                kept.append(chunk)
+                keys.append(chunk_keys)
+        if keys:
+            # Sorted for searchsorted; repeated keys are harmless and cheaper than np.unique
+            seen = np.sort(np.concatenate([seen] + keys))
+        return kept, seen, dropped
+    
+    @staticmethod
+    def _csv_state(csv_file: str, previous: Optional[Dict] = None) -> Optional[Dict]:
+        """mtime, size and content hash of a file (None if missing); unchanged stats reuse the previous hash"""
+        try:
+            stat = os.stat(csv_file)
+        except FileNotFoundError:
+            return None
+        if previous is not None and (previous["mtime_ns"], previous["size"]) == (stat.st_mtime_ns, stat.st_size):
+            return previous
+        with open(csv_file, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest}
+    
+    def _build_store(self, frames: List[pd.DataFrame]) -> LocationStore:
+        """Combine per-file frames into a columnar store with spatial indexes"""
+        with span("store_build"):
+            store = LocationStore.from_frames(frames)
+        rprint(Panel(f"🗺️ Spatial index built for {len(store.indexes)} location types", style="blue"))
+        return store
+    
+    @span("load_csv_data")
     def load_csv_data(self, csv_files: List[str] = None) -> bool:
         """Load and process multiple CSV data files"""
         if csv_files is None:
             csv_files = ["bunker.csv", "embassies.csv", "bunkers.csv", "heat.csv"]
         
         try:
-            combined_dfs = []
+            # Fingerprint before parsing so a write during the read shows up on the next reload
+            states = {csv_file: self._csv_state(csv_file) for csv_file in csv_files}
+            if self._load_snapshot(csv_files, states):
+                return True
+            
+            frames = []
             total_records = 0
             file_stats = {}
+            duplicates = {}
+            seen = np.empty(0, dtype=np.uint64)
             
+            # Files are streamed in order; a place already loaded from an earlier file is skipped
             for csv_file in csv_files:
-                try:
-                    # Load individual CSV file
-                    df = pd.read_csv(csv_file)
-                    df.columns = df.columns.str.strip()
-                    
-                    # Ensure required columns exist
-                    required_columns = ['lat', 'lon', 'type']
-                    for col in required_columns:
-                        if col not in df.columns:
-                            rprint(Panel(f"⚠️ Warning: '{col}' column missing in {csv_file}", style="yellow"))
-                            continue
-                    
-                    # Add source file information
-                    df['source_file'] = csv_file
-                    
-                    # Use 'city' if exists, otherwise use 'name'
-                    if 'city' not in df.columns and 'name' in df.columns:
-                        df['city'] = df['name']
-                    elif 'city' not in df.columns:
-                        df['city'] = f"Location from {csv_file}"
-                    
-                    combined_dfs.append(df)
-                    file_stats[csv_file] = {
-                        'records': len(df),
-                        'types': df['type'].value_counts().to_dict() if 'type' in df.columns else {}
-                    }
-                    total_records += len(df)
-                    
-                    rprint(Panel(f"✅ Loaded {csv_file}: {len(df)} records", style="green"))
-                    
-                except FileNotFoundError:
-                    rprint(Panel(f"⚠️ File not found: {csv_file} - skipping", style="yellow"))
-                    continue
-                except Exception as file_error:
-                    rprint(Panel(f"❌ Error loading {csv_file}: {file_error}", style="red"))
+                chunks = self._read_csv_file(csv_file)
+                if chunks is None:
                     continue
+                
+                chunks, seen, duplicates[csv_file] = self._drop_known_locations(chunks, seen)
+                frames.extend(chunks)
+                records = sum(len(chunk) for chunk in chunks)
+                types = pd.concat([chunk['type'].value_counts() for chunk in chunks]).groupby(
+                    level=0, observed=True).sum() if chunks else pd.Series(dtype=int)
+                file_stats[csv_file] = {
+                    'records': records,
+                    'types': types[types > 0].sort_values(ascending=False).to_dict()
+                }
+                total_records += records
             
-            if not combined_dfs:
+            if not frames:
                 rprint(Panel("❌ No CSV files could be loaded successfully", style="red"))
                 return False
             
-            # Combine all DataFrames
-            self.df = pd.concat(combined_dfs, ignore_index=True)
-            self.df.columns = self.df.columns.str.strip()
+            # Combine all chunks
+            self.store = self._build_store(frames)
+            self.csv_files = list(csv_files)
+            self._csv_states = states
+            self._csv_duplicates = duplicates
+            self._save_snapshot()
             
             # Display summary
             rprint(Panel(f"✅ Combined CSV data loaded: {total_records} total records", style="green"))
+            if sum(duplicates.values()):
+                rprint(Panel(f"🧹 Skipped {sum(duplicates.values())} locations already listed in an earlier file",
+                             style="blue"))
             
             # Show breakdown by file
             for file_name, stats in file_stats.items():
@@ -95,16 +303,155 @@ class IsraelSafetyRAGBot:
                     rprint(Panel(f"📊 {file_name}: {stats['records']} records ({type_info})", style="blue"))
             
             # Show overall type distribution
-            if 'type' in self.df.columns:
-                overall_types = self.df['type'].value_counts().to_dict()
-                rprint(Panel(f"📈 Overall data types: {overall_types}", style="cyan"))
+            overall_types = self.store.summary['data_types']
+            rprint(Panel(f"📈 Overall data types: {overall_types}", style="cyan"))
             
+            self.answer_cache.invalidate()
             return True
             
         except Exception as e:
             rprint(Panel(f"❌ Error loading CSV data: {e}", style="red"))
             return False
     
+    def _load_snapshot(self, csv_files: List[str], states: Dict[str, Optional[Dict]]) -> bool:
+        """Use the binary snapshot instead of parsing when it was built from these exact files"""
+        started = time.perf_counter()
+        try:
+            with span("snapshot_load"):
+                store = load_snapshot(self.snapshot_path, states)
+        except Exception as e:
+            rprint(Panel(f"⚠️ Ignoring unreadable location snapshot: {e}", style="yellow"))
+            return False
+        if store is None:
+            return False
+        
+        self.store = store
+        self.csv_files = list(csv_files)
+        self._csv_states = states
+        self._csv_duplicates = {}
+        self.answer_cache.invalidate()
+        rprint(Panel(f"⚡ Loaded {len(store)} records from snapshot in "
+                     f"{(time.perf_counter() - started) * 1000:.1f} ms", style="green"))
+        return True
+    
+    def attach_snapshot(self, csv_files: Optional[List[str]] = None) -> bool:
+        """Use the snapshot another process built from the current CSV files instead of parsing them.
+        
+        True when the store matches the files on disk (already, or after loading the snapshot);
+        False while no snapshot of these exact files exists yet.
+        """
+        csv_files = csv_files or self.csv_files
+        states = {csv_file: self._csv_state(csv_file, self._csv_states.get(csv_file)) for csv_file in csv_files}
+        if self.store is not None and list(csv_files) == self.csv_files and states == self._csv_states:
+            return True
+        return self._load_snapshot(csv_files, states)
+    
+    def _save_snapshot(self):
+        """Write the current store as a binary snapshot; failures only cost the next warm start"""
+        try:
+            with span("snapshot_save"):
+                save_snapshot(self.store, self.snapshot_path, self._csv_states)
+        except Exception as e:
+            rprint(Panel(f"⚠️ Could not write location snapshot: {e}", style="yellow"))
+    
+    @span("reload_csv_data")
+    def reload_csv_data(self) -> Dict:
+        """Re-read the CSV files whose mtime and content hash changed and swap in the new data.
+        
+        Rows of files before the first changed one are taken from the current store. Later files
+        are deduplicated again against the new data, re-reading those that had rows dropped as
+        duplicates. The new store replaces the old one in a single assignment, then only the
+        vectors of the affected files are re-synced. A file that fails to parse keeps its
+        previous rows and is retried on the next reload.
+        """
+        with self._reload_lock:
+            started = time.perf_counter()
+            parsed = {}
+            states = dict(self._csv_states)
+            changed, failed = [], []
+            
+            for csv_file in self.csv_files:
+                previous = self._csv_states.get(csv_file)
+                state = self._csv_state(csv_file, previous)
+                if state is previous or (state is not None and previous is not None
+                                         and state["sha256"] == previous["sha256"]):
+                    # Unchanged, or touched with identical content: just remember the new mtime
+                    states[csv_file] = state
+                    continue
+                
+                if state is None:
+                    rprint(Panel(f"⚠️ File removed: {csv_file}", style="yellow"))
+                else:
+                    chunks = self._read_csv_file(csv_file)
+                    if chunks is None:
+                        failed.append(csv_file)
+                        continue
+                    parsed[csv_file] = chunks
+                states[csv_file] = state
+                changed.append(csv_file)
+            
+            frames, duplicates, affected = [], dict(self._csv_duplicates), []
+            if changed:
+                # Which rows count as duplicates depends on the files before them, so every file from
+                # the first changed one on is deduplicated again
+                current = self.store.to_frame()
+                first = min(self.csv_files.index(csv_file) for csv_file in changed)
+                earlier = current[current['source_file'].isin(self.csv_files[:first])]
+                frames, seen = [earlier], np.sort(location_keys(earlier))
+                affected = self.csv_files[first:]
+                for csv_file in affected:
+                    if states[csv_file] is None:
+                        continue
+                    # Rows of the file missing from the store; unknown after a snapshot load
+                    hidden = duplicates.get(csv_file, 1)
+                    chunks = parsed.get(csv_file)
+                    if chunks is None and csv_file not in failed and hidden:
+                        # Rows hidden behind a changed file may be unique now, so parse the file again
+                        chunks = self._read_csv_file(csv_file)
+                    if chunks is not None:
+                        hidden = 0
+                    else:
+                        chunks = [current[current['source_file'] == csv_file]]
+                    chunks, seen, dropped = self._drop_known_locations(chunks, seen)
+                    duplicates[csv_file] = hidden + dropped
+                    frames.extend(chunks)
+                frames = [frame for frame in frames if len(frame)]
+            if changed and not frames:
+                rprint(Panel("⚠️ Every CSV file is gone - keeping the previous data", style="yellow"))
+                changed, failed, states = [], failed + changed, self._csv_states
+            self._csv_states = states
+            
+            result = {"changed": changed, "failed": failed, "records": len(self.store) if self.store else 0,
+                      "vectors_added": 0, "vectors_removed": 0}
+            if changed:
+                self.store = self._build_store(frames)
+                self._csv_duplicates = duplicates
+                self._save_snapshot()
+                self.answer_cache.invalidate()
+                result["records"] = len(self.store)
+                
+                if self.vectorstore is not None:
+                    added, removed = self._sync_vectorstore(
+                        self.create_documents_from_csv(source_files=affected), source_files=affected
+                    )
+                    result["vectors_added"], result["vectors_removed"] = added, removed
+                    self.answer_cache.invalidate()
+                
+                rprint(Panel(f"🔄 Reloaded {', '.join(changed)}: {result['records']} records, "
+                             f"{result['vectors_added']} vectors updated, {result['vectors_removed']} removed",
+                             style="green"))
+            
+            result["seconds"] = round(time.perf_counter() - started, 3)
+            return result
+    
+    def distances_from(self, user_lat, user_lon):
+        """Distances in km from one or many user points to every loaded location.
+        
+        Columns follow the store's row ids: a single point returns shape (n,),
+        arrays of m latitudes/longitudes return shape (m, n).
+        """
+        return self.store.coordinates.distances_from(user_lat, user_lon)
+    
     def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """Calculate distance between two points in kilometers using Haversine formula"""
         R = 6371  # Earth's radius in km
@@ -119,163 +466,280 @@ class IsraelSafetyRAGBot:
         return R * c
     
     def _create_content_by_type(self, row: pd.Series) -> str:
-        """Create content based on location type"""
-        city_name = row.get('city', row.get('name', 'Unknown Location'))
-        source_file = row.get('source_file', 'data')
-        
-        content_templates = {
-            'bunker': f"""
-            BUNKER - {city_name} ({row['lat']}, {row['lon']})
-            Maximum protection from rockets/explosions. Go here during alerts.
-            Source: {source_file}
-            """,
-            'shelter': f"""
-            SHELTER - {city_name} ({row['lat']}, {row['lon']})
-            Good protection during air raids. Stay until all-clear.
-            Source: {source_file}
-            """,
-            'embassy': f"""
-            EMBASSY - {city_name} ({row['lat']}, {row['lon']})
-            Safe diplomatic facility. Contact for citizen services and emergency assistance.
-            Source: {source_file}
-            """,
-            'heat': f"""
-            HEAT ZONE - {city_name} ({row['lat']}, {row['lon']})
-            High temperature area. Risk of heat-related health issues. Stay hydrated, seek shade.
-            Source: {source_file}
-            """,
-            'shooting': f"""
-            SHOOTING ALERT - {city_name} ({row['lat']}, {row['lon']})
-            AVOID AREA. Call 100 (Police). Very dangerous situation
-            Source: {source_file}
-            """,
-            'bomb': f"""
-            BOMB ALERT - {city_name} ({row['lat']}, {row['lon']})
-            EVACUATE 500m+. Call 100 (Police). Extremely dangerous situation
-            Source: {source_file}
-            """
+        """Create content based on location type (single-row form of _render_contents)"""
+        template = CONTENT_TEMPLATES.get(row['type'], DEFAULT_CONTENT_TEMPLATE)
+        return template.format(
+            city=row.get('city', row.get('name', 'Unknown Location')),
+            lat=row['lat'], lon=row['lon'], type=row['type'],
+            source=row.get('source_file', 'data')
+        )
+    
+    def _render_contents(self, frame: pd.DataFrame) -> np.ndarray:
+        """Render document text for a block of rows column-wise, one template per type group"""
+        columns = {
+            'city': _as_text(frame['city']),
+            'lat': _as_text(frame['lat']),
+            'lon': _as_text(frame['lon']),
+            'type': _as_text(frame['type']),
+            'source': _as_text(frame['source_file']),
         }
+        contents = np.empty(len(frame), dtype=object)
+        
+        for loc_type, rows in frame.groupby('type', sort=False, dropna=False, observed=True).indices.items():
+            template = CONTENT_TEMPLATES.get(loc_type, DEFAULT_CONTENT_TEMPLATE)
+            # Concatenate the template's literal pieces with whole field columns
+            text = np.full(len(rows), "", dtype=object)
+            for literal, field, _, _ in Formatter().parse(template):
+                text = text + literal
+                if field is not None:
+                    text = text + columns[field][rows]
+            contents[rows] = text
         
-        return content_templates.get(row['type'], f"""
-        LOCATION - {city_name} ({row['lat']}, {row['lon']})
-        Type: {row['type']} - Location information available
-        Source: {source_file}
-        """)
+        return contents
     
-    def create_documents_from_csv(self) -> List[Document]:
-        """Convert CSV data into LangChain documents"""
-        documents = []
+    def create_documents_from_csv(self, source_files: Optional[List[str]] = None) -> Iterator[Document]:
+        """Lazily convert CSV data into LangChain documents, one block of rows at a time.
         
-        for _, row in self.df.iterrows():
-            content = self._create_content_by_type(row)
-            
-            doc = Document(
-                page_content=content,
-                metadata={
-                    "type": row['type'],
-                    "city": row.get('city', row.get('name', 'Unknown')),
-                    "lat": float(row['lat']),
-                    "lon": float(row['lon']),
-                    "source": row.get('source_file', 'israel_safety_database'),
-                    "source_file": row.get('source_file', 'data.csv')
-                }
+        `source_files` limits the documents to rows loaded from those files.
+        """
+        from langchain_core.documents import Document
+        
+        df = self.df
+        if source_files is not None:
+            df = df[df['source_file'].isin(source_files)]
+        
+        # Identical rows within one file share a key, so number the repeats
+        occurrences = df.groupby(
+            ['source_file', 'type', 'lat', 'lon', 'city'], sort=False, dropna=False, observed=True
+        ).cumcount().to_numpy()
+        
+        for start in range(0, len(df), DOCUMENT_BLOCK_ROWS):
+            frame = df.iloc[start:start + DOCUMENT_BLOCK_ROWS]
+            contents = self._render_contents(frame)
+            types = frame['type'].to_numpy(dtype=object)
+            cities = frame['city'].to_numpy(dtype=object)
+            sources = frame['source_file'].to_numpy(dtype=object)
+            lats = frame['lat'].to_numpy(dtype='float64')
+            lons = frame['lon'].to_numpy(dtype='float64')
+            id_keys = (_as_text(frame['source_file']) + "|" + _as_text(frame['type']) + "|"
+                       + _as_text(frame['lat'].astype(float)) + "|" + _as_text(frame['lon'].astype(float))
+                       + "|" + _as_text(frame['city']))
+            
+            for content, loc_type, city, source, lat, lon, id_key, occurrence in zip(
+                    contents, types, cities, sources, lats, lons, id_keys, occurrences[start:start + len(frame)]):
+                doc_id = hashlib.sha1(id_key.encode("utf-8")).hexdigest()
+                if occurrence:
+                    doc_id = f"{doc_id}-{occurrence}"
+                
+                yield Document(id=doc_id, page_content=content, metadata={
+                    "type": loc_type,
+                    "city": city,
+                    "lat": float(lat),
+                    "lon": float(lon),
+                    "source": source,
+                    "source_file": source,
+                    "content_hash": hashlib.sha1(content.encode("utf-8")).hexdigest()
+                })
+    
+    @span("vectorstore_sync")
+    def _sync_vectorstore(self, documents: Iterable[Document],
+                          source_files: Optional[List[str]] = None) -> tuple:
+        """Upsert new or changed documents and delete removed ones; returns (added, deleted).
+        
+        With `source_files`, only stored documents from those files are compared and removed.
+        """
+        where = {"source_file": {"$in": source_files}} if source_files else None
+        existing_hashes = {}
+        for offset in itertools.count(0, VECTORSTORE_PAGE_SIZE):
+            page = self.vectorstore.get(where=where, include=["metadatas"], limit=VECTORSTORE_PAGE_SIZE, offset=offset)
+            existing_hashes.update(
+                (doc_id, (metadata or {}).get("content_hash"))
+                for doc_id, metadata in zip(page["ids"], page["metadatas"])
             )
-            documents.append(doc)
+            if len(page["ids"]) < VECTORSTORE_PAGE_SIZE:
+                break
+        current_ids = set()
         
-        return documents
+        def changed_documents():
+            for doc in documents:
+                current_ids.add(doc.id)
+                if existing_hashes.get(doc.id) != doc.metadata["content_hash"]:
+                    yield doc
+        
+        from ingestion import IngestionPipeline
+        
+        pipeline = IngestionPipeline(
+            self.embeddings, self.vectorstore._collection, batch_size=self.embed_batch_size,
+            max_workers=self.embed_workers, parallel=self.embed_parallel
+        )
+        self.ingest_stats = pipeline.run(changed_documents())
+        
+        removed_ids = [doc_id for doc_id in existing_hashes if doc_id not in current_ids]
+        for start in range(0, len(removed_ids), VECTORSTORE_PAGE_SIZE):
+            self.vectorstore.delete(ids=removed_ids[start:start + VECTORSTORE_PAGE_SIZE])
+        
+        self._write_sync_state()
+        return self.ingest_stats["documents"], len(removed_ids)
+    
+    def _sync_state_path(self) -> str:
+        return os.path.join(self.db_path, SYNC_STATE_NAME)
+    
+    def _write_sync_state(self):
+        """Record that the collection now holds exactly the current store's documents"""
+        temporary = f"{self._sync_state_path()}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"etag": self.store.etag, "embeddings": self.embeddings.model_name}, f)
+        os.replace(temporary, self._sync_state_path())
+    
+    def _vectorstore_in_sync(self) -> bool:
+        """Whether the last sync was for this exact data and embedding model (and nothing was lost since)"""
+        try:
+            with open(self._sync_state_path(), encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        return (state.get("etag") == self.store.etag and state.get("embeddings") == self.embeddings.model_name
+                and self.vectorstore._collection.count() == len(self.store))
+    
+    def sync_vectorstore(self) -> tuple:
+        """Bring the open vector collection up to date with every current row; returns (added, deleted)"""
+        with self._reload_lock:
+            return self._sync_vectorstore(self.create_documents_from_csv())
+    
+    def reopen_vectorstore(self):
+        """Open the collection again with a new client, to search vectors another process wrote.
+        
+        Chroma keeps each process's vector index in memory, so a client opened earlier keeps
+        answering from the old vectors even though it counts the new ones.
+        """
+        from chromadb.api.client import SharedSystemClient
+        
+        with self._reload_lock:
+            SharedSystemClient.clear_system_cache()
+            self._open_vectorstore()
+            self.answer_cache.invalidate()
     
-    def setup_vectorstore(self) -> bool:
-        """Initialize ChromaDB vectorstore with embeddings"""
+    def _open_vectorstore(self):
+        """Open (or create) the persisted Chroma collection"""
+        from langchain_community.vectorstores import Chroma
+        
+        with span("vectorstore_open"):
+            self.vectorstore = Chroma(
+                collection_name=COLLECTION_NAME,
+                embedding_function=self.embeddings,
+                persist_directory=self.db_path
+            )
+    
+    @span("setup_vectorstore")
+    def setup_vectorstore(self, sync: bool = True) -> bool:
+        """Initialize ChromaDB vectorstore with embeddings, embedding only new or changed rows.
+        
+        With sync=False the persisted collection is used as another process built it and is
+        never written or cleaned (worker processes in multi-worker mode).
+        """
         try:
             rprint(Panel("🔧 Setting up embeddings...", style="yellow"))
             
+            # Heavy model/vector-store libraries are imported on first use to keep startup fast
+            from embedding_cache import CachedEmbeddings, EmbeddingCache
+            
+            if self.embedding_cache is None:
+                self.embedding_cache = EmbeddingCache(self.embedding_cache_path)
+            
             try:
-                self.embeddings = OllamaEmbeddings(model="mxbai-embed-large")
+                from langchain_ollama import OllamaEmbeddings
+                
+                self.embeddings = CachedEmbeddings(
+                    OllamaEmbeddings(model="mxbai-embed-large"),
+                    "ollama/mxbai-embed-large", self.embedding_cache
+                )
+                self.embed_parallel = True
                 rprint(Panel("✅ Using mxbai-embed-large for embeddings", style="green"))
             except Exception:
                 rprint(Panel("🔄 Falling back to HuggingFace embeddings...", style="yellow"))
-                self.embeddings = HuggingFaceEmbeddings(
-                    model_name="sentence-transformers/all-MiniLM-L6-v2"
+                from langchain_community.embeddings import HuggingFaceEmbeddings
+                
+                self.embeddings = CachedEmbeddings(
+                    HuggingFaceEmbeddings(
+                        model_name="sentence-transformers/all-MiniLM-L6-v2",
+                        encode_kwargs={"batch_size": self.embed_batch_size}
+                    ),
+                    "huggingface/all-MiniLM-L6-v2", self.embedding_cache
                 )
+                # Local model: one batched forward pass at a time instead of a thread pool
+                self.embed_parallel = False
             
-            documents = self.create_documents_from_csv()
-            
-            try:
-                # Try to create/connect to vectorstore
-                self.vectorstore = Chroma.from_documents(
-                    documents=documents,
-                    embedding=self.embeddings,
-                    persist_directory=self.db_path,
-                    collection_name="israel_safety_data"
-                )
-                rprint(Panel("✅ Vector database created successfully!", style="green"))
-                return True
-                
-            except Exception as vectorstore_error:
-                # Check if it's a dimension mismatch error
-                if "dimension" in str(vectorstore_error).lower():
-                    rprint(Panel(f"⚠️ Dimension mismatch detected: {vectorstore_error}", style="yellow"))
-                    rprint(Panel("🔄 Cleaning database and recreating with new embedding dimensions...", style="yellow"))
+            # Hold the reload lock so a hot reload cannot sync the same files concurrently
+            with self._reload_lock:
+                try:
+                    # Reuse the persisted collection and only embed what changed; nothing to compare
+                    # when it was last synced for exactly this data
+                    self._open_vectorstore()
+                    added, deleted = 0, 0
+                    if sync and not self._vectorstore_in_sync():
+                        added, deleted = self._sync_vectorstore(self.create_documents_from_csv())
                     
-                    # Clean database and try again
-                    if self.clean_database(confirm=False):  # Auto-confirm cleanup
-                        self.vectorstore = Chroma.from_documents(
-                            documents=documents,
-                            embedding=self.embeddings,
-                            persist_directory=self.db_path,
-                            collection_name="israel_safety_data"
-                        )
-                        rprint(Panel("✅ Vector database recreated successfully with new dimensions!", style="green"))
-                        return True
+                except Exception as vectorstore_error:
+                    # Check if it's a dimension mismatch error
+                    if sync and "dimension" in str(vectorstore_error).lower():
+                        rprint(Panel(f"⚠️ Dimension mismatch detected: {vectorstore_error}", style="yellow"))
+                        rprint(Panel("🔄 Cleaning database and recreating with new embedding dimensions...", style="yellow"))
+                        
+                        # Clean database and try again
+                        if self.clean_database(confirm=False):  # Auto-confirm cleanup
+                            self._open_vectorstore()
+                            added, deleted = self._sync_vectorstore(self.create_documents_from_csv())
+                        else:
+                            raise Exception("Failed to clean database for dimension mismatch")
                     else:
-                        raise Exception("Failed to clean database for dimension mismatch")
-                else:
-                    raise vectorstore_error
+                        raise vectorstore_error
+            
+            cache_stats = self.embedding_cache.stats()
+            rprint(Panel(f"💾 Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                         f"{cache_stats['entries']} entries", style="blue"))
+            if not sync:
+                rprint(Panel(f"✅ Attached to the shared vector database ({len(self.store)} locations)", style="green"))
+            elif added or deleted:
+                rprint(Panel(f"✅ Vector database updated: {added} embedded, {deleted} removed, "
+                             f"{len(self.store)} total", style="green"))
+            else:
+                rprint(Panel(f"✅ Vector database up to date: {len(self.store)} documents reused", style="green"))
+            
+            # Cached answers were built from the previous data; match new questions semantically
+            self.answer_cache.embeddings = self.embeddings
+            self.answer_cache.invalidate()
+            self.intent_router.set_embeddings(self.embeddings)
+            return True
             
         except Exception as e:
             rprint(Panel(f"❌ Error setting up vectorstore: {e}", style="red"))
             return False
     
     def setup_qa_chain(self) -> bool:
-        """Setup the RAG QA chain"""
+        """Setup the LLM and prompt used for RAG answers"""
         try:
+            from langchain_core.prompts import PromptTemplate
+            from langchain_ollama import ChatOllama
+            
             llm = ChatOllama(model=self.model_name, temperature=0.1)
             custom_prompt = PromptTemplate(
-                template="""You are an AI emergency assistant for Israel safety. Provide IMMEDIATE, CLEAR, and ACTIONABLE responses.
+                template="""You are an AI emergency assistant for Israel safety. Give IMMEDIATE, CLEAR, ACTIONABLE answers.
+- Prioritize SAFETY; be calm but supportive
+- Include emergency contact numbers and relevant locations
+- Plain text, bullet points with -, emphasis with single asterisks *like this*
+- NO double asterisks, emojis or other markdown
 
-INSTRUCTIONS:
-- Prioritize SAFETY above all else
-- Use SIMPLE markdown formatting ONLY: bold text with single asterisks *like this*
-- DO NOT use double asterisks, complex formatting, or special characters
-- Start important sections with simple bullet points using -
-- Include emergency contact numbers when relevant
-- Be calm but supportive
-- Include relevant location information
-- Keep responses clear and readable
+Locations:
+{context}
 
-FORMATTING RULES:
-- Use *text* for emphasis (single asterisks only)
-- Use simple bullet points with -
-- Use plain text for most content
-- NO fancy symbols, emojis, or complex markdown
-
-Context: {context}
 Question: {question}
 
 Emergency response:""",
                 input_variables=["context", "question"]
             )
             
-            self.qa_chain = RetrievalQA.from_chain_type(
-                llm=llm,
-                chain_type="stuff",
-                retriever=self.vectorstore.as_retriever(
-                    search_type="similarity",
-                    search_kwargs={"k": 5}
-                ),
-                chain_type_kwargs={"prompt": custom_prompt},
-                return_source_documents=True
-            )
+            self.llm = llm
+            self.prompt = custom_prompt
             
             rprint(Panel("✅ Emergency QA system ready!", style="green"))
             return True
@@ -287,52 +751,359 @@ Emergency response:""",
     def find_nearest_safety_location(self, user_lat: float, user_lon: float, 
                                    safety_type: Optional[str] = None) -> Optional[Dict]:
         """Find nearest bunker or shelter"""
-        if safety_type:
-            filtered_df = self.df[self.df['type'] == safety_type]
-        else:
-            filtered_df = self.df[self.df['type'].isin(['bunker', 'shelter'])]
+        store = self.store
+        safety_types = [safety_type] if safety_type else SAFETY_TYPES
+        with span("nearest_search"):
+            hits = store.nearest(user_lat, user_lon, safety_types, k=1)
         
-        if filtered_df.empty:
+        if not hits:
             return None
+        
+        return store.record(*hits[0])
+    
+    def find_nearest_safety_locations_batch(self, user_lats: List[float], user_lons: List[float],
+                                            safety_type: Optional[str] = None) -> List[Optional[Dict]]:
+        """Find the nearest bunker or shelter for many user points in one vectorized pass"""
+        store = self.store
+        safety_types = [safety_type] if safety_type else SAFETY_TYPES
+        best_ids, best_distances = store.nearest_batch(user_lats, user_lons, safety_types)
+        
+        found = best_ids >= 0
+        records = store.records(best_ids[found], best_distances[found])
+        results: List[Optional[Dict]] = [None] * len(best_ids)
+        for position, record in zip(np.flatnonzero(found), records):
+            results[position] = record
+        return results
+    
+    @staticmethod
+    def _without_danger(store: LocationStore, hits: List[tuple], radius_km: float) -> List[tuple]:
+        """Drop hits with a danger location (shooting, bomb) within radius_km"""
+        return [(row_id, distance) for row_id, distance in hits
+                if not store.any_within(*store.position(row_id), radius_km, DANGER_TYPES)]
+    
+    def find_k_nearest_safety_locations(self, user_lat: float, user_lon: float, k: int = 5,
+                                        safety_types: Optional[List[str]] = None,
+                                        max_distance_km: Optional[float] = None,
+                                        avoid_danger_km: Optional[float] = None) -> List[Dict]:
+        """Find the k nearest safety locations, optionally skipping those near danger zones"""
+        store = self.store
+        safety_types = safety_types or SAFETY_TYPES
+        
+        # Over-fetch until k locations survive the danger filter, every candidate was seen or
+        # DANGER_FILTER_MAX_ROUNDS is reached. Only hits up to the distance where the merged
+        # per-type lists are complete count: past it a closer location of another type may
+        # not have been fetched yet.
+        fetch = k
+        for _ in range(DANGER_FILTER_MAX_ROUNDS):
+            hits, complete_km = store.nearest_complete(user_lat, user_lon, safety_types, fetch, max_distance_km)
+            hits = [hit for hit in hits if hit[1] <= complete_km]
+            if avoid_danger_km:
+                hits = self._without_danger(store, hits, avoid_danger_km)
+            if len(hits) >= k or complete_km == math.inf:
+                break
+            fetch *= 2
+        
+        return [store.record(row_id, distance) for row_id, distance in hits[:k]]
+    
+    def find_locations_within(self, user_lat: float, user_lon: float, radius_km: float,
+                              location_types: Optional[List[str]] = None,
+                              avoid_danger_km: Optional[float] = None) -> List[Dict]:
+        """Find all locations of the given types within radius_km, nearest first"""
+        store = self.store
+        location_types = location_types or SAFETY_TYPES
+        
+        hits = store.within(user_lat, user_lon, radius_km, location_types)
+        if avoid_danger_km:
+            hits = self._without_danger(store, hits, avoid_danger_km)
+        
+        return [store.record(row_id, distance) for row_id, distance in hits]
+    
+    def _question_embedder(self, question: str) -> Callable[[], List[float]]:
+        """Embed a question on first call and return the same vector on later ones, so the router,
+        the answer cache and retrieval share one embedding per request"""
+        vectors = []
+        
+        def embed() -> List[float]:
+            if not vectors:
+                with span("embed_query"):
+                    vectors.append(self.embeddings.embed_query(question))
+            return vectors[0]
+        return embed
+    
+    def _retrieve(self, question: str, user_lat: Optional[float] = None, user_lon: Optional[float] = None,
+                  embed: Optional[Callable[[], List[float]]] = None) -> List[Document]:
+        """Retrieve the context documents for a question.
+        
+        Without coordinates or type hints this is a plain RETRIEVER_K similarity search; otherwise
+        the hybrid retriever narrows the search with metadata filters first.
+        """
+        location_types = self.intent_router.detect_types(question.lower())
+        # Embedded once, so a hybrid miss does not embed again
+        vector = (embed or self._question_embedder(question))()
+        
+        documents = []
+        if (user_lat is not None and user_lon is not None) or location_types:
+            documents = self._hybrid_retrieve(vector, user_lat, user_lon, location_types)
+        if not documents:
+            with span("vector_search"):
+                documents = self.vectorstore.similarity_search_by_vector(vector, k=RETRIEVER_K)
+        return documents
+    
+    def _hybrid_retrieve(self, vector: List[float], user_lat: Optional[float], user_lon: Optional[float],
+                         location_types: Optional[List[str]] = None) -> List[Document]:
+        """Vector search restricted by type and a bounding box, re-ranked by similarity and distance.
+        
+        The box radius is the distance to the HYBRID_FETCH_K-th nearest matching location
+        from the spatial index, so dense areas get a tight box and sparse ones a wider one.
+        """
+        clauses = [{"type": {"$in": location_types}}] if location_types else []
+        if user_lat is None or user_lon is None:
+            with span("vector_search"):
+                return self.vectorstore.similarity_search_by_vector(vector, k=HYBRID_TOP_K, filter=clauses[0])
+        
+        store = self.store
+        with span("geo_candidates"):
+            hits = store.nearest(user_lat, user_lon, location_types or list(store.indexes), HYBRID_FETCH_K)
+        if not hits:
+            return []
+        radius_km = max(hits[:HYBRID_FETCH_K][-1][1], HYBRID_MIN_RADIUS_KM)
+        
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        clauses += [{"lat": {"$gte": user_lat - dlat}}, {"lat": {"$lte": user_lat + dlat}}]
+        cos_lat = math.cos(math.radians(min(abs(user_lat) + dlat, 90.0)))
+        if cos_lat > 1e-6 and dlat / cos_lat < 180:
+            dlon = dlat / cos_lat
+            clauses += [{"lon": {"$gte": user_lon - dlon}}, {"lon": {"$lte": user_lon + dlon}}]
+        
+        with span("vector_search"):
+            scored = self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+                vector, k=HYBRID_FETCH_K, filter={"$and": clauses}
+            )
+        if not scored:
+            return []
+        
+        with span("rerank"):
+            # Map raw vector distances into (0, 1] whatever the embedding scale
+            documents = [doc for doc, _ in scored]
+            similarity = 1.0 / (1.0 + np.asarray([score for _, score in scored], dtype=np.float64))
+            distances = haversine_km(user_lat, user_lon,
+                                     [doc.metadata["lat"] for doc in documents],
+                                     [doc.metadata["lon"] for doc in documents])
+            proximity = 1.0 - np.minimum(distances / radius_km, 1.0)
+            blended = HYBRID_SIMILARITY_WEIGHT * similarity + (1 - HYBRID_SIMILARITY_WEIGHT) * proximity
             
-        min_distance = float('inf')
-        nearest_location = None
-        
-        for _, row in filtered_df.iterrows():
-            distance = self.calculate_distance(user_lat, user_lon, row['lat'], row['lon'])
-            if distance < min_distance:
-                min_distance = distance
-                nearest_location = {
-                    'type': row['type'],
-                    'name': row['name'],
-                    'lat': row['lat'],
-                    'lon': row['lon'],
-                    'distance_km': round(distance, 2)
-                }
+            order = np.argsort(-blended, kind="stable")[:HYBRID_TOP_K]
+            return [documents[i] for i in order]
+    
+    @staticmethod
+    def _answer_scope(user_lat: Optional[float], user_lon: Optional[float]) -> str:
+        """Cache scope of a located question: its grid cell, or "" without coordinates"""
+        if user_lat is None or user_lon is None:
+            return ""
+        return f"{math.floor(user_lat / ANSWER_SCOPE_CELL_DEG)}:{math.floor(user_lon / ANSWER_SCOPE_CELL_DEG)}"
+    
+    def _build_prompt(self, question: str, documents: List[Document]) -> tuple:
+        """Fill the QA prompt with compact, deduplicated context lines within context_token_budget.
+        
+        Returns (prompt, documents used in it); logs and records the prompt's token counts.
+        """
+        context, documents, stats = build_context(documents, self.context_token_budget)
+        prompt = self.prompt.format(context=context, question=question)
+        stats["prompt_tokens"] = estimate_tokens(prompt)
+        PROMPT_TOKENS.observe(stats["prompt_tokens"], part="prompt")
+        logger.info(f"🧾 Prompt ~{stats['prompt_tokens']} tokens: context ~{stats['context_tokens']} tokens from "
+                    f"{stats['kept']} of {stats['documents']} documents ({stats['merged']} merged, "
+                    f"{stats['trimmed']} trimmed)", extra={"prompt": stats})
+        return prompt, documents
+    
+    @staticmethod
+    def _record_prompt_usage(message):
+        """Record the prompt size the model reports (Ollama's prompt_eval_count), when it does"""
+        usage = getattr(message, "usage_metadata", None) or {}
+        if usage.get("input_tokens"):
+            PROMPT_TOKENS.observe(usage["input_tokens"], part="model")
+    
+    def _format_locations(self, documents: List[Document]) -> str:
+        """Render the top retrieved locations as a simple markdown block"""
+        if not documents:
+            return ""
+        
+        block = "\n\n*Relevant Locations:*\n"
+        for doc in documents[:3]:
+            metadata = doc.metadata
+            block += f"- {metadata['type'].upper()} in {metadata['city']} "
+            block += f"(GPS: {metadata['lat']}, {metadata['lon']})\n"
+        return block
+    
+    def find_locations_in_city(self, city: str, location_types: Optional[List[str]] = None,
+                               limit: int = 10) -> List[Dict]:
+        """Find locations whose city name contains the given text (case-insensitive)"""
+        store = self.store
+        records = []
+        for row_id in store.in_city(city, location_types, limit):
+            record = store.record(int(row_id), 0.0)
+            del record['distance_km']
+            records.append(record)
+        return records
+    
+    def route_question(self, question: str, user_lat: Optional[float] = None,
+                       user_lon: Optional[float] = None, use_embeddings: bool = True,
+                       embed: Optional[Callable[[], List[float]]] = None) -> Optional[str]:
+        """Answer structured questions directly from the data; None means use the RAG chain"""
+        started = time.perf_counter()
+        with span("route"):
+            route, params = self.intent_router.classify(question, use_embeddings=use_embeddings, embed=embed)
+        
+        answer = None
+        if route == EMERGENCY:
+            answer = self._handle_emergency_command()
+        elif route == NEAREST and user_lat is not None and user_lon is not None:
+            locations = self.find_k_nearest_safety_locations(user_lat, user_lon, k=3, safety_types=params['types'])
+            if locations:
+                answer = "*Nearest Safety Locations:*\n"
+                for location in locations:
+                    answer += (f"\n- *{location['type'].upper()}* in {location['city']}: {location['distance_km']} km "
+                               f"(GPS: {location['lat']}, {location['lon']})")
+                answer += "\n\n*Emergency Contacts:*\nPolice: 100 | Medical: 101 | Fire: 102"
+        elif route == CITY:
+            locations = self.find_locations_in_city(params['city'], params['types'])
+            if locations:
+                answer = f"*Safety Locations in {params['city'].title()}:*\n"
+                for location in locations:
+                    answer += (f"\n- *{location['type'].upper()}* in {location['city']} "
+                               f"(GPS: {location['lat']}, {location['lon']})")
+                answer += "\n\n*Emergency Contacts:*\nPolice: 100 | Medical: 101 | Fire: 102"
         
-        return nearest_location
-    def get_emergency_response(self, question: str) -> str:
-        """Get emergency response using RAG"""
+        if answer is not None:
+            self.intent_router.record(route, time.perf_counter() - started)
+        return answer
+    
+    def question_key(self, question: str, user_lat: Optional[float] = None,
+                     user_lon: Optional[float] = None) -> str:
+        """Key under which identical concurrent questions are answered once"""
+        return f"{self._answer_scope(user_lat, user_lon)}\0{normalize_question(question)}"
+    
+    def get_emergency_response(self, question: str, user_lat: Optional[float] = None,
+                               user_lon: Optional[float] = None, coalesce: bool = True) -> str:
+        """Get emergency response, answering structured questions directly and the rest with RAG.
+        
+        Concurrent identical RAG questions share one chain run, unless the caller already
+        coalesces them (coalesce=False).
+        """
+        with span("ask"):
+            embed = self._question_embedder(question)
+            answer = self.route_question(question, user_lat, user_lon, embed=embed)
+            if answer is not None:
+                return answer
+            
+            started = time.perf_counter()
+            if coalesce:
+                answer = self.inflight_questions.do(
+                    self.question_key(question, user_lat, user_lon),
+                    lambda: self._generate_emergency_response(question, user_lat, user_lon, embed)
+                )
+            else:
+                answer = self._generate_emergency_response(question, user_lat, user_lon, embed)
+            self.intent_router.record(RAG, time.perf_counter() - started)
+            return answer
+    
+    def _generate_emergency_response(self, question: str, user_lat: Optional[float] = None,
+                                     user_lon: Optional[float] = None,
+                                     embed: Optional[Callable[[], List[float]]] = None) -> str:
+        """Answer a question from the cache or by retrieval plus generation"""
         try:
-            with console.status("[bold red]🚨 Processing emergency query...", spinner="dots"):
-                result = self.qa_chain({"query": question})
+            embed = embed or self._question_embedder(question)
+            scope = self._answer_scope(user_lat, user_lon)
+            with span("answer_cache_lookup"):
+                cached = self.answer_cache.get(question, scope, embed)
+            if cached is not None:
+                return cached["answer"] + self._format_locations(cached["documents"])
             
-            response = result['result']
+            with span("retrieve"):
+                documents = self._retrieve(question, user_lat, user_lon, embed)
+            with span("prompt_build"):
+                prompt, documents = self._build_prompt(question, documents)
+            with span("llm_generate"):
+                message = self.llm.invoke(prompt)
+            self._record_prompt_usage(message)
+            response = message.content
+            self.answer_cache.put(question, {"answer": response, "documents": documents}, scope, embed)
             
             # Add source information with simple formatting
-            if result.get('source_documents'):
-                response += "\n\n*Relevant Locations:*\n"
-                for i, doc in enumerate(result['source_documents'][:3], 1):
-                    metadata = doc.metadata
-                    response += f"- {metadata['type'].upper()} in {metadata['city']} "
-                    response += f"(GPS: {metadata['lat']}, {metadata['lon']})\n"
-            
-            return response
+            return response + self._format_locations(documents)
             
         except Exception as e:
             return (f"Emergency system error: {e}\n\n"
                    "IMMEDIATE ACTION: Call emergency services 100 (Police), 101 (Medical)")
     
+    @staticmethod
+    def _answer_events(answer: str, documents: Optional[List[Document]] = None) -> List[Dict]:
+        """Stream events of a complete answer, after its locations when there are any"""
+        events = [] if documents is None else [IsraelSafetyRAGBot._locations_event(documents)]
+        return events + [{"event": "token", "data": answer}, {"event": "done", "data": ""}]
+    
+    @staticmethod
+    def _locations_event(documents: List[Document]) -> Dict:
+        return {
+            "event": "locations",
+            "data": [
+                {key: doc.metadata[key] for key in ("type", "city", "lat", "lon")}
+                for doc in documents[:3]
+            ]
+        }
+    
+    @staticmethod
+    def _error_event(error: Exception) -> Dict:
+        return {"event": "error",
+                "data": (f"Emergency system error: {error}\n\n"
+                         "IMMEDIATE ACTION: Call emergency services 100 (Police), 101 (Medical)")}
+    
+    def stream_without_llm(self, question: str, user_lat: Optional[float] = None,
+                           user_lon: Optional[float] = None,
+                           embed: Optional[Callable[[], List[float]]] = None) -> Optional[List[Dict]]:
+        """Stream events of a routed or cached answer; None means the question needs generation.
+        
+        Routed answers are a single "token" event; cached ones send their "locations" first.
+        """
+        try:
+            embed = embed or self._question_embedder(question)
+            answer = self.route_question(question, user_lat, user_lon, embed=embed)
+            if answer is not None:
+                return self._answer_events(answer)
+            
+            with span("answer_cache_lookup"):
+                cached = self.answer_cache.get(question, self._answer_scope(user_lat, user_lon), embed)
+            return None if cached is None else self._answer_events(cached["answer"], cached["documents"])
+        except Exception as e:
+            return [self._error_event(e)]
+    
+    def stream_generated_response(self, question: str, user_lat: Optional[float] = None,
+                                  user_lon: Optional[float] = None,
+                                  embed: Optional[Callable[[], List[float]]] = None) -> Iterator[Dict]:
+        """Stream a generated response: retrieved locations first, then LLM tokens as generated.
+        
+        Yields {"event": ..., "data": ...} dicts with events "locations", "token", "done"
+        or "error". Callers check stream_without_llm first.
+        """
+        try:
+            embed = embed or self._question_embedder(question)
+            prompt, documents = self._build_prompt(question, self._retrieve(question, user_lat, user_lon, embed))
+            yield self._locations_event(documents)
+            
+            tokens = []
+            for chunk in self.llm.stream(prompt):
+                self._record_prompt_usage(chunk)
+                if chunk.content:
+                    tokens.append(chunk.content)
+                    yield {"event": "token", "data": chunk.content}
+            self.answer_cache.put(question, {"answer": "".join(tokens), "documents": documents},
+                                  self._answer_scope(user_lat, user_lon), embed)
+            
+            yield {"event": "done", "data": ""}
+            
+        except Exception as e:
+            yield self._error_event(e)
+    
     def show_emergency_help(self):
         """Show emergency commands and help"""
         help_text = """
@@ -389,6 +1160,8 @@ Emergency response:""",
             
             # Method 1: Try to delete collections first
             try:
+                import chromadb
+                
                 client = chromadb.PersistentClient(path=self.db_path)
                 collections = client.list_collections()
                 
@@ -413,6 +1186,8 @@ Emergency response:""",
             
             # Reset vectorstore
             self.vectorstore = None
+            if os.path.exists(self._sync_state_path()):
+                os.remove(self._sync_state_path())
             
             rprint(Panel("✅ ChromaDB cleaned successfully! Database is now empty.", style="green"))
             return True
@@ -455,7 +1230,8 @@ Emergency response:""",
                     continue
                 
                 # Get AI response
-                response = self.get_emergency_response(user_input)
+                with console.status("[bold red]🚨 Processing emergency query...", spinner="dots"):
+                    response = self.get_emergency_response(user_input)
                 rprint(Panel(response, title="🚨 Emergency Response", style="red"))
                 
             except KeyboardInterrupt:
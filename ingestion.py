@@ -0,0 +1,85 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from rich import print as rprint
+from rich.panel import Panel
+from rich.progress import BarColumn, Progress, TextColumn, TimeElapsedColumn
+
+from metrics import span
+
+
+class IngestionPipeline:
+    """Embed a stream of documents in fixed-size batches and upsert them into a Chroma collection.
+
+    With parallel=True (remote HTTP backends such as Ollama) up to max_workers batches are
+    embedded concurrently; otherwise each batch is one forward pass of a local model, still
+    overlapped with the previous batch's write.
+    """
+
+    def __init__(self, embeddings: Embeddings, collection, batch_size: int = 64,
+                 max_workers: int = 4, parallel: bool = True):
+        self.embeddings = embeddings
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_workers = max_workers if parallel else 1
+
+    def _batches(self, documents: Iterable[Document]) -> Iterator[List[Document]]:
+        iterator = iter(documents)
+        while batch := list(islice(iterator, self.batch_size)):
+            yield batch
+
+    @span("embed_batch")
+    def _embed(self, batch: List[Document]) -> tuple:
+        return batch, self.embeddings.embed_documents([doc.page_content for doc in batch])
+
+    @span("vector_write")
+    def _write(self, batch: List[Document], vectors: List[List[float]]):
+        self.collection.upsert(
+            ids=[doc.id for doc in batch],
+            embeddings=vectors,
+            metadatas=[doc.metadata for doc in batch],
+            documents=[doc.page_content for doc in batch]
+        )
+
+    def run(self, documents: Iterable[Document], total: Optional[int] = None) -> Dict:
+        """Embed and write all documents; returns document count, elapsed time and throughput"""
+        written = 0
+        start = time.perf_counter()
+
+        with Progress(TextColumn("[yellow]🧠 Embedding"), BarColumn(),
+                      TextColumn("{task.completed} docs • {task.fields[rate]:.1f} docs/s"),
+                      TimeElapsedColumn(), transient=True) as progress, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            task = progress.add_task("embed", total=total, rate=0.0)
+            pending = deque()
+
+            def write_next():
+                nonlocal written
+                batch, vectors = pending.popleft().result()
+                self._write(batch, vectors)
+                written += len(batch)
+                progress.update(task, advance=len(batch), rate=written / (time.perf_counter() - start))
+
+            # Keep a bounded number of batches in flight so memory stays flat
+            for batch in self._batches(documents):
+                pending.append(pool.submit(self._embed, batch))
+                if len(pending) >= self.max_workers * 2:
+                    write_next()
+            while pending:
+                write_next()
+
+        elapsed = time.perf_counter() - start
+        stats = {
+            "documents": written,
+            "seconds": round(elapsed, 3),
+            "docs_per_second": round(written / elapsed, 1) if elapsed > 0 else 0.0
+        }
+        if written:
+            rprint(Panel(f"🧠 Embedded {written} documents in {stats['seconds']}s "
+                         f"({stats['docs_per_second']} docs/s)", style="blue"))
+        return stats
@@ -0,0 +1,131 @@
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Intents answered without the LLM; everything else goes to the RAG chain
+EMERGENCY = "emergency"
+NEAREST = "nearest"
+CITY = "city"
+RAG = "rag"
+
+TYPE_KEYWORDS = [
+    (re.compile(r"\bembass(?:y|ies)\b"), ["embassy"]),
+    (re.compile(r"\b(?:bunkers?|shelters?|safe (?:place|room|location)s?)\b"), ["bunker", "shelter"]),
+]
+
+EMERGENCY_PATTERN = re.compile(
+    r"\b(?:emergency (?:instructions|help|actions)|(?:hear|there are|there is) (?:the )?sirens?|"
+    r"(?:rocket|missile) (?:alert|attack)s?|red alert)\b"
+)
+# "What do I do" is only an emergency together with an alert cue; otherwise it is an open question
+WHAT_TO_DO_PATTERN = re.compile(r"\bwhat (?:should|do|can) i do\b")
+ALERT_PATTERN = re.compile(r"\b(?:(?<!heat )alerts?|sirens?|rockets?|missiles?|air raids?|incoming)\b")
+NEAREST_PATTERN = re.compile(r"\b(?:nearest|closest|near me|nearby|close to me|around me)\b")
+CITY_PATTERN = re.compile(
+    r"\b(?:bunkers?|shelters?|embass(?:y|ies)|safe places?)\s+(?:in|at|near)\s+"
+    r"(?P<city>[a-z][a-z\s'-]*?)\s*(?:[?.!,]|$|\b(?:right now|now|today)\b)"
+)
+
+INTENT_EXAMPLES = {
+    EMERGENCY: [
+        "what should I do during a rocket alert",
+        "give me emergency instructions",
+        "I hear sirens, what do I do",
+    ],
+    NEAREST: [
+        "where is the nearest bunker",
+        "closest shelter to my location",
+        "find a safe place near me",
+    ],
+}
+
+
+class IntentRouter:
+    """Keyword/regex intent classifier with an optional embedding nearest-centroid fallback.
+
+    classify() returns (intent, params): EMERGENCY, NEAREST (params["types"]),
+    CITY (params["city"], params["types"]) or RAG for open-ended questions.
+    """
+
+    def __init__(self, embeddings=None, centroid_threshold: float = 0.8):
+        self.centroid_threshold = centroid_threshold
+        self._centroids: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict] = {}
+        self.embeddings = None
+        if embeddings is not None:
+            self.set_embeddings(embeddings)
+
+    def set_embeddings(self, embeddings):
+        """Enable the nearest-centroid fallback, embedding the example phrases once"""
+        centroids = {}
+        for intent, examples in INTENT_EXAMPLES.items():
+            vectors = np.asarray(embeddings.embed_documents(examples), dtype=np.float32)
+            centroid = vectors.mean(axis=0)
+            centroids[intent] = centroid / np.linalg.norm(centroid)
+        self._centroids = centroids
+        self.embeddings = embeddings
+
+    @staticmethod
+    def detect_types(text: str) -> Optional[List[str]]:
+        """Location types mentioned in a (lowercased) question, or None"""
+        for pattern, types in TYPE_KEYWORDS:
+            if pattern.search(text):
+                return types
+        return None
+
+    def _nearest_centroid(self, text: str, embed: Optional[Callable[[], List[float]]] = None) -> Optional[str]:
+        vector = np.array(embed() if embed is not None else self.embeddings.embed_query(text), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        intent, score = max(((i, float(c @ vector)) for i, c in self._centroids.items()), key=lambda item: item[1])
+        return intent if score >= self.centroid_threshold else None
+
+    def classify(self, question: str, use_embeddings: bool = True,
+                 embed: Optional[Callable[[], List[float]]] = None) -> Tuple[str, Dict]:
+        """Classify a question into an intent and its extracted parameters.
+
+        embed, if given, returns the question's vector for the fallback, so a caller that needs
+        the vector anyway embeds the question only once.
+        """
+        text = question.lower().strip()
+        types = self.detect_types(text)
+
+        city_match = CITY_PATTERN.search(text)
+        if city_match and not NEAREST_PATTERN.search(text):
+            return CITY, {"city": city_match.group("city").strip(), "types": types}
+        if NEAREST_PATTERN.search(text) and types:
+            return NEAREST, {"types": types}
+        alert = ALERT_PATTERN.search(text)
+        if EMERGENCY_PATTERN.search(text) or (alert and WHAT_TO_DO_PATTERN.search(text)):
+            return EMERGENCY, {}
+
+        if use_embeddings and self.embeddings is not None:
+            intent = self._nearest_centroid(text, embed)
+            if intent == NEAREST:
+                return NEAREST, {"types": types or ["bunker", "shelter"]}
+            if intent == EMERGENCY and alert:
+                return EMERGENCY, {}
+
+        return RAG, {}
+
+    def record(self, route: str, seconds: float):
+        """Record the latency of one answered question for a route"""
+        with self._lock:
+            stats = self._stats.setdefault(route, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += seconds * 1000
+            stats["max_ms"] = max(stats["max_ms"], seconds * 1000)
+
+    def stats(self) -> Dict:
+        """Per-route request counts and latency"""
+        with self._lock:
+            return {
+                route: {
+                    "count": s["count"],
+                    "mean_ms": round(s["total_ms"] / s["count"], 3),
+                    "max_ms": round(s["max_ms"], 3)
+                }
+                for route, s in self._stats.items()
+            }
@@ -0,0 +1,363 @@
+import hashlib
+import json
+import math
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from typing import Dict, List, Optional
+
+from spatial import COORDINATE_FIELDS, CoordinateArrays, GeoIndex, band_keys
+
+# Columns kept for every location row; type, city and source_file are categorical
+LOCATION_COLUMNS = ['type', 'lat', 'lon', 'city', 'source_file']
+CATEGORY_COLUMNS = ['type', 'city', 'source_file']
+
+# Latitude band height of the per-type spatial indexes
+INDEX_CELL_DEG = 0.05
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Keep only the location columns, with numeric coordinates and categorical strings"""
+    df = df.reindex(columns=LOCATION_COLUMNS)
+    df['lat'] = pd.to_numeric(df['lat'], errors='coerce')
+    df['lon'] = pd.to_numeric(df['lon'], errors='coerce')
+    for column in CATEGORY_COLUMNS:
+        df[column] = df[column].astype('category')
+    return df
+
+
+def valid_rows(df: pd.DataFrame) -> np.ndarray:
+    """Mask of rows with a type and finite coordinates inside the latitude/longitude ranges"""
+    lat = df['lat'].to_numpy(dtype=np.float64, na_value=np.nan)
+    lon = df['lon'].to_numpy(dtype=np.float64, na_value=np.nan)
+    return df['type'].notna().to_numpy() & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+
+
+def location_keys(df: pd.DataFrame) -> np.ndarray:
+    """64-bit hash of each row's (type, lat, lon); equal for the same place in different files"""
+    return pd.util.hash_pandas_object(df[['type', 'lat', 'lon']], index=False).to_numpy()
+
+
+def _codes(categorical: pd.Categorical) -> np.ndarray:
+    """Category codes in the smallest signed integer type that holds them (-1 = missing)"""
+    dtype = np.int8 if len(categorical.categories) < 2 ** 7 else (
+        np.int16 if len(categorical.categories) < 2 ** 15 else np.int32)
+    return categorical.codes.astype(dtype)
+
+
+def _object_categories(column: pd.Series) -> pd.Categorical:
+    """The same categorical with object-dtype labels, so frames with str and object labels union"""
+    return pd.Categorical.from_codes(column.cat.codes, categories=column.cat.categories.astype(object))
+
+
+def _names(categorical: pd.Categorical) -> np.ndarray:
+    """Category labels as an object array with a trailing None, so code -1 indexes to None"""
+    return np.append(categorical.categories.to_numpy(dtype=object), None)
+
+
+class LocationStore:
+    """Columnar location table plus one spatial index per location type.
+
+    type, city and source are stored as small integer codes into per-column name tables and
+    coordinates as contiguous float64 arrays. Rows are ordered by type, then by spatial-index
+    band and longitude, so every type occupies one contiguous row range and its GeoIndex is a
+    view over the shared arrays rather than a copy. Row ids are positions in this order.
+
+    A store is built once and never modified: reloads build a new store and swap it in with
+    a single attribute assignment, so a caller holding a store never sees a mix of old and
+    new rows.
+
+    Name tables end with a None entry, so a missing value's code -1 looks up None.
+    """
+
+    def __init__(self, type_codes, type_names, lat, lon, city_codes, city_names,
+                 source_codes, source_names, cell_deg: float = INDEX_CELL_DEG):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        bands = band_keys(np.where(valid, lat, 0.0), cell_deg)
+        # Typeless rows sort last; rows without coordinates sort after the indexed rows of their type
+        type_key = np.where(np.asarray(type_codes) < 0, len(type_names), type_codes)
+        order = np.lexsort((np.where(valid, lon, 0.0), bands, ~valid, type_key))
+
+        self.type_codes = np.ascontiguousarray(np.asarray(type_codes)[order])
+        self.city_codes = np.ascontiguousarray(np.asarray(city_codes)[order])
+        self.source_codes = np.ascontiguousarray(np.asarray(source_codes)[order])
+        self.type_names = np.asarray(type_names, dtype=object)
+        self.city_names = np.asarray(city_names, dtype=object)
+        self.source_names = np.asarray(source_names, dtype=object)
+        self.coordinates = CoordinateArrays(lat[order], lon[order])
+        self.cell_deg = cell_deg
+
+        # Per-type [start, end) row ranges, and the indexable (finite) prefix of each range
+        valid = valid[order]
+        sorted_keys = type_key[order]
+        type_count = len(self.type_names) - 1
+        starts = np.searchsorted(sorted_keys, np.arange(type_count), side="left")
+        ends = np.searchsorted(sorted_keys, np.arange(type_count), side="right")
+        self.type_ranges: Dict[str, tuple] = {}
+        self.indexes: Dict[str, GeoIndex] = {}
+        for code, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+            if start == end:
+                continue
+            loc_type = self.type_names[code]
+            self.type_ranges[loc_type] = (start, end)
+            indexed_end = start + int(valid[start:end].sum())
+            self.indexes[loc_type] = GeoIndex.from_sorted(
+                self.coordinates.slice(start, indexed_end), np.arange(start, indexed_end), cell_deg
+            )
+
+        self.created = time.time()
+        self.summary = self._summarize()
+        # Identifies this store's rows for HTTP caching and syncing; identical data gives the same tag.
+        # The summary can stay the same when rows change (e.g. a moved location), so it has its own tag.
+        self.etag = self._data_tag()
+        self.summary_etag = hashlib.sha1(json.dumps(self.summary, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def from_parts(cls, parts: Dict) -> "LocationStore":
+        """Reassemble a store from the arrays and metadata of parts() without copying or sorting"""
+        store = cls.__new__(cls)
+        store.type_codes, store.city_codes, store.source_codes = (
+            parts["type_codes"], parts["city_codes"], parts["source_codes"])
+        store.type_names, store.city_names, store.source_names = (
+            np.asarray(parts[name], dtype=object) for name in ("type_names", "city_names", "source_names"))
+        store.coordinates = CoordinateArrays.from_arrays(*(parts[name] for name in COORDINATE_FIELDS))
+        store.cell_deg = parts["cell_deg"]
+        store.type_ranges = {t: tuple(r) for t, r in parts["type_ranges"].items()}
+        store.indexes = {}
+        for loc_type, (start, indexed_end) in parts["indexed_ranges"].items():
+            store.indexes[loc_type] = GeoIndex.from_sorted(
+                store.coordinates.slice(start, indexed_end), parts[f"index.{loc_type}.ids"], store.cell_deg,
+                bands=tuple(parts[f"index.{loc_type}.{name}"] for name in ("band_keys", "band_starts", "band_ends"))
+            )
+        store.created = parts["created"]
+        store.summary = parts["summary"]
+        store.etag = parts["etag"]
+        store.summary_etag = parts["summary_etag"]
+        return store
+
+    def parts(self) -> Dict:
+        """Every array and metadata field needed to rebuild this store with from_parts"""
+        parts = {
+            "type_codes": self.type_codes, "city_codes": self.city_codes, "source_codes": self.source_codes,
+            "type_names": self.type_names.tolist(), "city_names": self.city_names.tolist(),
+            "source_names": self.source_names.tolist(),
+            "cell_deg": self.cell_deg,
+            "type_ranges": {t: list(r) for t, r in self.type_ranges.items()},
+            "indexed_ranges": {},
+            "created": self.created, "summary": self.summary, "etag": self.etag,
+            "summary_etag": self.summary_etag
+        }
+        for name in COORDINATE_FIELDS:
+            parts[name] = getattr(self.coordinates, name)
+        for loc_type, index in self.indexes.items():
+            start = self.type_ranges[loc_type][0]
+            parts["indexed_ranges"][loc_type] = [start, start + len(index)]
+            for name in ("ids", "band_keys", "band_starts", "band_ends"):
+                parts[f"index.{loc_type}.{name}"] = getattr(index, name)
+        return parts
+
+    @classmethod
+    def from_frames(cls, frames: List[pd.DataFrame]) -> "LocationStore":
+        """Build a store from compacted per-file frames (see compact_frame)"""
+        columns = {
+            column: union_categoricals([_object_categories(frame[column]) for frame in frames],
+                                       ignore_order=True).remove_unused_categories()
+            for column in CATEGORY_COLUMNS
+        }
+        return cls(
+            _codes(columns['type']), _names(columns['type']),
+            np.concatenate([frame['lat'].to_numpy(dtype=np.float64) for frame in frames]),
+            np.concatenate([frame['lon'].to_numpy(dtype=np.float64) for frame in frames]),
+            _codes(columns['city']), _names(columns['city']),
+            _codes(columns['source_file']), _names(columns['source_file'])
+        )
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "LocationStore":
+        """Build a store from one DataFrame with the location columns"""
+        return cls.from_frames([compact_frame(df)])
+
+    def _data_tag(self) -> str:
+        """Hash of every row's type, city, source and coordinates"""
+        digest = hashlib.sha1()
+        for names in (self.type_names, self.city_names, self.source_names):
+            digest.update(json.dumps(names.tolist()).encode("utf-8"))
+        for array in (self.type_codes, self.city_codes, self.source_codes, self.coordinates.lat, self.coordinates.lon):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()[:16]
+
+    def _summarize(self, top_cities: int = 10) -> Dict:
+        """Counts and coverage figures behind /stats and /mix-report, computed once per store"""
+        def counts(codes: np.ndarray, names: np.ndarray, limit: Optional[int] = None) -> Dict:
+            # Most frequent first, like value_counts; the trailing None slot counts missing values
+            tally = np.bincount(codes[codes >= 0], minlength=len(names) - 1)
+            order = np.argsort(-tally, kind="stable")
+            order = order[tally[order] > 0][:limit]
+            return {names[i]: int(tally[i]) for i in order}
+
+        cities = counts(self.city_codes, self.city_names)
+        lat, lon = self.coordinates.lat, self.coordinates.lon
+        return {
+            "total_records": len(self),
+            "data_types": counts(self.type_codes, self.type_names),
+            "sources": counts(self.source_codes, self.source_names),
+            "city_count": len(cities),
+            "top_cities": dict(list(cities.items())[:top_cities]),
+            "missing_cities": int((self.city_codes < 0).sum()),
+            "lat_range": [float(np.nanmin(lat)), float(np.nanmax(lat))] if len(self) else [None, None],
+            "lon_range": [float(np.nanmin(lon)), float(np.nanmax(lon))] if len(self) else [None, None]
+        }
+
+    def __len__(self) -> int:
+        return len(self.type_codes)
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes held by the row columns, coordinate arrays and spatial indexes"""
+        coords = self.coordinates
+        return {
+            "codes": self.type_codes.nbytes + self.city_codes.nbytes + self.source_codes.nbytes,
+            "names": sum(sys.getsizeof(name) for names in (self.type_names, self.city_names, self.source_names)
+                         for name in names),
+            "coordinates": sum(getattr(coords, name).nbytes for name in COORDINATE_FIELDS),
+            "indexes": sum(index.ids.nbytes + index.band_keys.nbytes + index.band_starts.nbytes
+                           + index.band_ends.nbytes for index in self.indexes.values())
+        }
+
+    def to_frame(self) -> pd.DataFrame:
+        """The rows as a DataFrame with categorical string columns, in row-id order (built on demand)"""
+        def categorical(codes: np.ndarray, names: np.ndarray) -> pd.Categorical:
+            return pd.Categorical.from_codes(codes, categories=pd.Index(names[:-1], dtype=object))
+
+        return pd.DataFrame({
+            'type': categorical(self.type_codes, self.type_names),
+            'lat': self.coordinates.lat,
+            'lon': self.coordinates.lon,
+            'city': categorical(self.city_codes, self.city_names),
+            'source_file': categorical(self.source_codes, self.source_names)
+        }, copy=False)
+
+    def record(self, row_id: int, distance: float) -> Dict:
+        """Build a location result dict for a row"""
+        city = self.city_names[self.city_codes[row_id]]
+        return {
+            'type': self.type_names[self.type_codes[row_id]],
+            'name': city,
+            'city': city,
+            'lat': float(self.coordinates.lat[row_id]),
+            'lon': float(self.coordinates.lon[row_id]),
+            'source_file': self.source_names[self.source_codes[row_id]],
+            'distance_km': round(float(distance), 2)
+        }
+
+    def records(self, row_ids: np.ndarray, distances: np.ndarray) -> List[Dict]:
+        """Build location result dicts for many rows with vectorized column lookups"""
+        types = self.type_names[self.type_codes[row_ids]]
+        cities = self.city_names[self.city_codes[row_ids]]
+        sources = self.source_names[self.source_codes[row_ids]]
+        lats = self.coordinates.lat[row_ids]
+        lons = self.coordinates.lon[row_ids]
+        rounded = np.round(distances, 2)
+        return [
+            {'type': t, 'name': c, 'city': c, 'lat': float(la), 'lon': float(lo),
+             'source_file': src, 'distance_km': float(d)}
+            for t, c, src, la, lo, d in zip(types, cities, sources, lats, lons, rounded)
+        ]
+
+    def position(self, row_id: int) -> tuple:
+        """(lat, lon) of a row"""
+        return self.coordinates.lat[row_id], self.coordinates.lon[row_id]
+
+    def rows_of_type(self, loc_type: str) -> slice:
+        """Row ids of one location type, as a slice"""
+        start, end = self.type_ranges.get(loc_type, (0, 0))
+        return slice(start, end)
+
+    def count(self, location_types: List[str]) -> int:
+        """Number of indexed rows of the given types"""
+        return sum(len(self.indexes[t]) for t in location_types if t in self.indexes)
+
+    def nearest(self, lat: float, lon: float, location_types: List[str], k: int,
+                max_distance_km: Optional[float] = None) -> List[tuple]:
+        """Merge per-type k-nearest results into (row_id, distance) pairs sorted by distance"""
+        return self.nearest_complete(lat, lon, location_types, k, max_distance_km)[0]
+
+    def nearest_complete(self, lat: float, lon: float, location_types: List[str], k: int,
+                         max_distance_km: Optional[float] = None) -> tuple:
+        """nearest() plus the distance up to which the merged list holds every matching row.
+
+        A type with k hits may have more rows just beyond its k-th hit, so the list is only
+        complete up to the smallest such k-th distance; inf when every type ran out of rows.
+        """
+        hits = []
+        complete_km = math.inf
+        for loc_type in location_types:
+            index = self.indexes.get(loc_type)
+            if index is None:
+                continue
+            ids, distances = index.query_nearest(lat, lon, k=k, max_distance_km=max_distance_km)
+            hits.extend(zip(ids.tolist(), distances.tolist()))
+            if len(ids) >= k:
+                complete_km = min(complete_km, float(distances[-1]))
+        hits.sort(key=lambda hit: hit[1])
+        return hits, complete_km
+
+    def nearest_batch(self, lats, lons, location_types: List[str]) -> tuple:
+        """(row_ids, distances) of the nearest row of the given types per point; -1/inf if none"""
+        best_ids = np.full(len(lats), -1, dtype=np.int64)
+        best_distances = np.full(len(lats), np.inf)
+        for loc_type in location_types:
+            index = self.indexes.get(loc_type)
+            if index is None:
+                continue
+            ids, distances = index.query_nearest_batch(lats, lons)
+            closer = distances < best_distances
+            best_ids[closer], best_distances[closer] = ids[closer], distances[closer]
+        return best_ids, best_distances
+
+    def within(self, lat: float, lon: float, radius_km: float, location_types: List[str]) -> List[tuple]:
+        """(row_id, distance) pairs of the given types within radius_km, nearest first"""
+        hits = []
+        for loc_type in location_types:
+            index = self.indexes.get(loc_type)
+            if index is None:
+                continue
+            ids, distances = index.query_radius(lat, lon, radius_km)
+            hits.extend(zip(ids.tolist(), distances.tolist()))
+        hits.sort(key=lambda hit: hit[1])
+        return hits
+
+    def in_bbox(self, south: float, west: float, north: float, east: float,
+                location_types: List[str]) -> np.ndarray:
+        """Row ids of the given types inside a latitude/longitude box"""
+        ids = [self.indexes[t].query_bbox(south, west, north, east) for t in location_types if t in self.indexes]
+        return np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+
+    def any_within(self, lat: float, lon: float, radius_km: float, location_types: List[str]) -> bool:
+        """Whether any row of the given types lies within radius_km"""
+        for loc_type in location_types:
+            index = self.indexes.get(loc_type)
+            if index is not None and len(index.query_nearest(lat, lon, k=1, max_distance_km=radius_km)[0]):
+                return True
+        return False
+
+    def in_city(self, city: str, location_types: Optional[List[str]] = None, limit: int = 10) -> np.ndarray:
+        """Row ids whose city name contains the given text (case-insensitive)"""
+        # Match against the distinct names once, then select rows by code
+        names = pd.Series(self.city_names[:-1], dtype=object).astype(str)
+        matching_codes = np.flatnonzero(names.str.contains(city, case=False, regex=False).to_numpy())
+        if not len(matching_codes):
+            return np.empty(0, dtype=np.int64)
+
+        if location_types:
+            ranges = [self.rows_of_type(t) for t in location_types]
+        else:
+            ranges = [slice(0, len(self))]
+        row_ids = np.concatenate([
+            np.arange(r.start, r.stop)[np.isin(self.city_codes[r], matching_codes)] for r in ranges
+        ])
+        return np.sort(row_ids)[:limit]
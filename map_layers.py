@@ -0,0 +1,81 @@
+import math
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from location_store import LocationStore
+
+TILE_SIZE = 256
+# Points closer than this many screen pixels at the requested zoom merge into one cluster
+CLUSTER_CELL_PX = 64
+# From this zoom on points are sent individually, unless there are more than MAX_POINTS
+CLUSTER_MAX_ZOOM = 14
+MAX_POINTS = 5000
+MAX_ZOOM = 22
+MERCATOR_MAX_LAT = 85.0511287798
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple:
+    """(south, west, north, east) of a Web Mercator (slippy map) tile"""
+    n = 2 ** z
+
+    def lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def bbox_zoom(west: float, east: float, viewport_px: int = 1024) -> int:
+    """Map zoom at which a box of this width fills a viewport_px wide view"""
+    width = (east - west) % 360.0 or 360.0
+    return int(min(MAX_ZOOM, max(0, math.floor(math.log2(viewport_px * 360.0 / (TILE_SIZE * width))))))
+
+
+def _pixels(lat: np.ndarray, lon: np.ndarray, zoom: int) -> tuple:
+    """Web Mercator world pixel coordinates at a zoom level"""
+    scale = TILE_SIZE * 2.0 ** zoom
+    sin_lat = np.sin(np.radians(np.clip(lat, -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT)))
+    x = (lon + 180.0) / 360.0 * scale
+    y = (0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)) * scale
+    return x, y
+
+
+def _point(lon: float, lat: float, properties: Dict) -> Dict:
+    return {"type": "Feature", "geometry": {"type": "Point", "coordinates": [round(lon, 6), round(lat, 6)]},
+            "properties": properties}
+
+
+def layer_features(store: LocationStore, south: float, west: float, north: float, east: float,
+                   location_types: List[str], zoom: Optional[int] = None) -> Dict:
+    """GeoJSON FeatureCollection of the locations of the given types inside a box.
+
+    Below CLUSTER_MAX_ZOOM (or with more than MAX_POINTS locations) points of the same type
+    falling into one CLUSTER_CELL_PX grid cell are merged into a cluster feature at their
+    centroid with a point_count property; lone points stay individual features.
+    """
+    zoom = bbox_zoom(west, east) if zoom is None else zoom
+    row_ids = store.in_bbox(south, west, north, east, location_types)
+    lat, lon = store.coordinates.lat[row_ids], store.coordinates.lon[row_ids]
+    types = store.type_names[store.type_codes[row_ids]]
+    cities = store.city_names[store.city_codes[row_ids]]
+    clustered = zoom < CLUSTER_MAX_ZOOM or len(row_ids) > MAX_POINTS
+
+    if not clustered:
+        features = [_point(x, y, {"type": t, "city": c})
+                    for x, y, t, c in zip(lon.tolist(), lat.tolist(), types, cities)]
+    else:
+        px, py = _pixels(lat, lon, zoom)
+        # Cell columns and rows stay below 2**24 up to MAX_ZOOM, so (type, column, row) packs into an int64
+        cells = ((store.type_codes[row_ids].astype(np.int64) << 48)
+                 | ((px // CLUSTER_CELL_PX).astype(np.int64) << 24) | (py // CLUSTER_CELL_PX).astype(np.int64))
+        _, first, inverse, counts = np.unique(cells, return_index=True, return_inverse=True, return_counts=True)
+        centre_lat = np.bincount(inverse, weights=lat) / counts
+        centre_lon = np.bincount(inverse, weights=lon) / counts
+        features = [
+            _point(centre_lon[cell], centre_lat[cell], {"type": types[i], "cluster": True, "point_count": count})
+            if count > 1 else _point(lon[i], lat[i], {"type": types[i], "city": cities[i]})
+            for cell, (i, count) in enumerate(zip(first.tolist(), counts.tolist()))
+        ]
+
+    return {"type": "FeatureCollection", "features": features,
+            "count": int(len(row_ids)), "zoom": zoom, "clustered": bool(clustered)}
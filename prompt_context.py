@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import math
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+from metrics import REGISTRY, Counter, Histogram
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# One short clause per type for the prompt; the full document texts are for embedding
+COMPACT_GUIDANCE = {
+    'bunker': "max protection from rockets/explosions, go here during alerts",
+    'shelter': "protection during air raids, stay until all-clear",
+    'embassy': "diplomatic facility, citizen services and emergency assistance",
+    'heat': "high temperature area, stay hydrated, seek shade",
+    'shooting': "AVOID AREA, call 100 (Police)",
+    'bomb': "EVACUATE 500m+, call 100 (Police)"
+}
+
+# Rough size of a token for English text and digits; no tokenizer of the chat model is available offline
+CHARS_PER_TOKEN = 4.0
+# Results of one type whose coordinates agree to this many decimals (about 11 m) are one place
+COLOCATED_DECIMALS = 4
+
+PROMPT_TOKENS = REGISTRY.register(Histogram(
+    "safety_bot_prompt_tokens", "Tokens per LLM prompt: estimated context and prompt, and as counted by the model",
+    ["part"], buckets=(32, 64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 4096)))
+CONTEXT_DOCUMENTS = REGISTRY.register(Counter(
+    "safety_bot_context_documents_total", "Retrieved documents kept in, merged out of or trimmed from prompts",
+    ["outcome"]))
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def compact_line(metadata: Dict) -> str:
+    """One-line rendering of a location document, e.g. "BUNKER Haifa (32.794, 34.9896): max protection ..." """
+    loc_type = str(metadata.get('type'))
+    line = f"{loc_type.upper()} {metadata.get('city') or 'Unknown'} ({round(metadata['lat'], 4)}, {round(metadata['lon'], 4)})"
+    guidance = COMPACT_GUIDANCE.get(loc_type)
+    return f"{line}: {guidance}" if guidance else line
+
+
+def build_context(documents: List[Document], max_tokens: int) -> Tuple[str, List[Document], Dict]:
+    """Compact prompt context from ranked documents, within max_tokens (estimated).
+
+    Co-located documents of the same type (e.g. one bunker listed in two CSV files) keep only
+    the best-ranked one; the rest are added one line each in rank order while they fit.
+    Returns the context, the documents it covers and counts for reporting.
+    """
+    seen = set()
+    lines, kept, merged = [], [], 0
+    tokens = 0
+    for doc in documents:
+        metadata = doc.metadata
+        key = (metadata.get('type'), round(metadata['lat'], COLOCATED_DECIMALS),
+               round(metadata['lon'], COLOCATED_DECIMALS))
+        if key in seen:
+            merged += 1
+            continue
+        seen.add(key)
+
+        line = compact_line(metadata)
+        # Every line after the first also costs its newline
+        line_tokens = estimate_tokens(line) + (1 if lines else 0)
+        if tokens + line_tokens > max_tokens:
+            break
+        lines.append(line)
+        kept.append(doc)
+        tokens += line_tokens
+
+    stats = {"documents": len(documents), "kept": len(kept), "merged": merged,
+             "trimmed": len(documents) - len(kept) - merged, "context_tokens": tokens}
+    for outcome in ("kept", "merged", "trimmed"):
+        if stats[outcome]:
+            CONTEXT_DOCUMENTS.inc(stats[outcome], outcome=outcome)
+    PROMPT_TOKENS.observe(tokens, part="context")
+    return "\n".join(lines), kept, stats
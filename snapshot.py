@@ -0,0 +1,78 @@
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from location_store import LocationStore
+
+# Bump SNAPSHOT_VERSION whenever the arrays or metadata written by LocationStore.parts() change
+SNAPSHOT_FORMAT = "israel-safety-locations"
+SNAPSHOT_VERSION = 3
+MANIFEST_NAME = "manifest.json"
+
+
+def source_hashes(sources: Dict[str, Optional[Dict]]) -> List[List[Optional[str]]]:
+    """[path, content hash] per source file in load order (None for a missing file) from
+    _csv_state-style dicts; the order matters because earlier files win duplicate rows"""
+    return [[path, state["sha256"] if state else None] for path, state in sources.items()]
+
+
+def save_snapshot(store: LocationStore, path: str, sources: Dict[str, Optional[Dict]]):
+    """Write a store as one .npy file per array plus a JSON manifest naming them.
+
+    Each write uses fresh array file names and swaps the manifest in with os.replace, so a
+    reader always sees a complete snapshot; files of older snapshots are removed afterwards.
+    """
+    os.makedirs(path, exist_ok=True)
+    generation = f"{store.etag}-{time.time_ns()}"
+    arrays, meta = {}, {}
+    for number, (key, value) in enumerate(store.parts().items()):
+        if isinstance(value, np.ndarray):
+            arrays[key] = f"{generation}.{number}.npy"
+            np.save(os.path.join(path, arrays[key]), np.ascontiguousarray(value), allow_pickle=False)
+        else:
+            meta[key] = value
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "rows": len(store),
+        "sources": source_hashes(sources),
+        "arrays": arrays,
+        "meta": meta
+    }
+    temporary = os.path.join(path, f"{MANIFEST_NAME}.{os.getpid()}.tmp")
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(temporary, os.path.join(path, MANIFEST_NAME))
+
+    for name in os.listdir(path):
+        if name.endswith(".npy") and not name.startswith(generation):
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass
+
+
+def load_snapshot(path: str, sources: Dict[str, Optional[Dict]]) -> Optional[LocationStore]:
+    """Memory-map the snapshot at path if it was built from exactly these source files, in this order, else None"""
+    try:
+        with open(os.path.join(path, MANIFEST_NAME), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if (manifest.get("format"), manifest.get("version")) != (SNAPSHOT_FORMAT, SNAPSHOT_VERSION):
+        return None
+    if manifest["sources"] != source_hashes(sources):
+        return None
+
+    parts = dict(manifest["meta"])
+    try:
+        for key, filename in manifest["arrays"].items():
+            parts[key] = np.load(os.path.join(path, filename), mmap_mode="r", allow_pickle=False)
+    except FileNotFoundError:
+        # Replaced by a newer snapshot between reading the manifest and the arrays
+        return None
+    return LocationStore.from_parts(parts)
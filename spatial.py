@@ -0,0 +1,300 @@
+import numpy as np
+from typing import Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+
+# Arrays held by CoordinateArrays, in constructor order of CoordinateArrays.from_arrays
+COORDINATE_FIELDS = ("lat", "lon", "lat_rad", "lon_rad", "cos_lat")
+
+# Indexes up to this size answer batch queries with one distance-matrix pass per chunk
+BATCH_MATRIX_MAX_ROWS = 1024
+# Upper bound on distance-matrix cells computed at once by batch queries
+BATCH_MATRIX_MAX_CELLS = 4_000_000
+# Larger indexes compare each query point with its longitude neighbours in nearby bands:
+# (bands on either side, points on either side) per pass; unproven points go to the next pass
+BATCH_WINDOWS = ((1, 8), (1, 32), (4, 32))
+# Band numbers are scaled by this in the packed (band, lon + 180) sort key
+BAND_KEY_STRIDE = 1000.0
+
+# Above this many candidates in the latitude strip, narrow each band by longitude first
+BAND_SCAN_THRESHOLD = 2048
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Vectorized haversine distance in km between degree coordinates (NumPy broadcasting)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def band_keys(lat, cell_deg: float) -> np.ndarray:
+    """Latitude band number of each point for a GeoIndex with the given band height"""
+    return np.floor(np.asarray(lat, dtype=np.float64) / cell_deg).astype(np.int64)
+
+
+class CoordinateArrays:
+    """Contiguous float64 coordinates with radians and latitude cosines precomputed once"""
+
+    def __init__(self, lat, lon):
+        self.lat = np.ascontiguousarray(lat, dtype=np.float64)
+        self.lon = np.ascontiguousarray(lon, dtype=np.float64)
+        self.lat_rad = np.radians(self.lat)
+        self.lon_rad = np.radians(self.lon)
+        self.cos_lat = np.cos(self.lat_rad)
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    @classmethod
+    def from_arrays(cls, lat, lon, lat_rad, lon_rad, cos_lat) -> "CoordinateArrays":
+        """Wrap precomputed arrays (e.g. memory-mapped from a snapshot) without copying"""
+        coords = cls.__new__(cls)
+        coords.lat, coords.lon, coords.lat_rad, coords.lon_rad, coords.cos_lat = lat, lon, lat_rad, lon_rad, cos_lat
+        return coords
+
+    def slice(self, start: int, end: int) -> "CoordinateArrays":
+        """View of rows [start, end) sharing this object's arrays (no copy, no recomputation)"""
+        return CoordinateArrays.from_arrays(*(getattr(self, name)[start:end] for name in COORDINATE_FIELDS))
+
+    def distances_from(self, lat, lon, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """Distances in km from one or many points to the stored points.
+
+        A scalar point returns shape (n,), an array of m points returns shape (m, n).
+        `positions` restricts the computation to a subset of the stored points.
+        """
+        lat_rad, lon_rad, cos_lat = self.lat_rad, self.lon_rad, self.cos_lat
+        if positions is not None:
+            lat_rad, lon_rad, cos_lat = lat_rad[positions], lon_rad[positions], cos_lat[positions]
+
+        q_lat = np.radians(np.asarray(lat, dtype=np.float64))
+        q_lon = np.radians(np.asarray(lon, dtype=np.float64))
+        if q_lat.ndim:
+            q_lat, q_lon = q_lat[:, None], q_lon[:, None]
+
+        a = np.sin((lat_rad - q_lat) / 2) ** 2 + np.cos(q_lat) * cos_lat * np.sin((lon_rad - q_lon) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class GeoIndex:
+    """Latitude-band grid index over a set of points for exact radius and k-nearest queries.
+
+    Points are bucketed into fixed-height latitude bands and sorted by (band, lon), so the
+    rows within any latitude window form one contiguous slice and each band can be narrowed
+    by longitude with a binary search. Distances are great-circle (haversine) kilometres.
+    """
+
+    def __init__(self, lat, lon, ids=None, cell_deg: float = 0.05):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if ids is None:
+            ids = np.arange(len(lat), dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        lat, lon, ids = lat[valid], lon[valid], ids[valid]
+
+        order = np.lexsort((lon, band_keys(lat, cell_deg)))
+        self._set_points(CoordinateArrays(lat[order], lon[order]), ids[order], cell_deg)
+
+    @classmethod
+    def from_sorted(cls, coords: CoordinateArrays, ids, cell_deg: float = 0.05,
+                    bands: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None) -> "GeoIndex":
+        """Index points already ordered by (band_keys(lat, cell_deg), lon), all finite.
+
+        The coordinate arrays and ids are used as given, so slices of a larger presorted
+        table (or memory-mapped arrays) can be indexed without copying. `bands` optionally
+        supplies a previously computed (band_keys, band_starts, band_ends).
+        """
+        index = cls.__new__(cls)
+        index._set_points(coords, np.asarray(ids, dtype=np.int64), cell_deg, bands)
+        return index
+
+    def _set_points(self, coords: CoordinateArrays, ids: np.ndarray, cell_deg: float, bands=None):
+        self.cell_deg = cell_deg
+        self.coords = coords
+        self.lon = coords.lon
+        self.ids = ids if ids.flags.c_contiguous else np.ascontiguousarray(ids)
+
+        if bands is None:
+            keys, starts = np.unique(band_keys(coords.lat, cell_deg), return_index=True)
+            bands = (keys, starts, np.append(starts[1:], len(coords)))
+        self.band_keys, self.band_starts, self.band_ends = bands
+        self._packed_keys = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _sorted_keys(self) -> np.ndarray:
+        """Ascending (band, lon) key of every point, for searching many bands at once"""
+        if self._packed_keys is None:
+            bands = np.repeat(self.band_keys, self.band_ends - self.band_starts)
+            self._packed_keys = bands * BAND_KEY_STRIDE + (self.lon + 180.0)
+        return self._packed_keys
+
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Positions of points that may lie within radius_km (a superset of the exact answer)"""
+        dlat = np.degrees(radius_km / EARTH_RADIUS_KM)
+        lo = np.searchsorted(self.band_keys, np.floor((lat - dlat) / self.cell_deg), side="left")
+        hi = np.searchsorted(self.band_keys, np.floor((lat + dlat) / self.cell_deg), side="right")
+        if lo >= hi:
+            return np.empty(0, dtype=np.int64)
+
+        start, end = self.band_starts[lo], self.band_ends[hi - 1]
+        if end - start <= BAND_SCAN_THRESHOLD:
+            return np.arange(start, end)
+
+        # Narrow each band by longitude; the widest longitude span is at the highest latitude
+        max_abs_lat = min(abs(lat) + dlat, 90.0)
+        cos_lat = np.cos(np.radians(max_abs_lat))
+        if cos_lat < 1e-6:
+            return np.arange(start, end)
+        dlon = np.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+        if dlon >= 180 or lon - dlon < -180 or lon + dlon > 180:
+            return np.arange(start, end)
+
+        ranges = []
+        for band_start, band_end in zip(self.band_starts[lo:hi], self.band_ends[lo:hi]):
+            band_lon = self.lon[band_start:band_end]
+            left = band_start + np.searchsorted(band_lon, lon - dlon, side="left")
+            right = band_start + np.searchsorted(band_lon, lon + dlon, side="right")
+            if left < right:
+                ranges.append(np.arange(left, right))
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+    def query_radius(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, distances_km) of all points within radius_km, sorted by distance"""
+        positions = self._candidates(lat, lon, radius_km)
+        distances = self.coords.distances_from(lat, lon, positions)
+        keep = distances <= radius_km
+        positions, distances = positions[keep], distances[keep]
+        order = np.argsort(distances, kind="stable")
+        return self.ids[positions[order]], distances[order]
+
+    def query_bbox(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Ids of the points inside a latitude/longitude box; west > east crosses the antimeridian"""
+        lo = np.searchsorted(self.band_keys, np.floor(south / self.cell_deg), side="left")
+        hi = np.searchsorted(self.band_keys, np.floor(north / self.cell_deg), side="right")
+        lon_ranges = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+
+        ranges = []
+        for band_start, band_end in zip(self.band_starts[lo:hi], self.band_ends[lo:hi]):
+            band_lon = self.lon[band_start:band_end]
+            for left_lon, right_lon in lon_ranges:
+                left = band_start + np.searchsorted(band_lon, left_lon, side="left")
+                right = band_start + np.searchsorted(band_lon, right_lon, side="right")
+                if left < right:
+                    ranges.append(np.arange(left, right))
+        if not ranges:
+            return np.empty(0, dtype=np.int64)
+
+        # Edge bands extend past the box in latitude
+        positions = np.concatenate(ranges)
+        lat = self.coords.lat[positions]
+        return self.ids[positions[(lat >= south) & (lat <= north)]]
+
+    def query_nearest(self, lat: float, lon: float, k: int = 1,
+                      max_distance_km: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, distances_km) of the k nearest points, sorted by distance"""
+        if len(self) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        half_circumference = np.pi * EARTH_RADIUS_KM
+        limit = half_circumference if max_distance_km is None else min(max_distance_km, half_circumference)
+        radius = min(self.cell_deg * 111.0, limit)
+
+        # Grow the search radius until it holds k points; anything nearer than the
+        # k-th hit must lie inside the same radius, so the answer is exact.
+        while True:
+            ids, distances = self.query_radius(lat, lon, radius)
+            if len(ids) >= k or radius >= limit:
+                return ids[:k], distances[:k]
+            radius = min(radius * 4, limit)
+
+    def _nearest_in_window(self, lats: np.ndarray, lons: np.ndarray, band_reach: int,
+                           lon_reach: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Nearest of the lon_reach longitude neighbours on either side in the band_reach bands
+        around each query point, and whether that is provably the nearest point overall.
+
+        Returns (positions, distances_km, exact). A point left out lies beyond the longitude
+        gap to the last neighbour looked at in its band, or outside the bands looked at, so the
+        hit is exact when neither lower bound is nearer than it.
+        """
+        cell = self.cell_deg
+        q_band = band_keys(lats, cell)
+        bands = q_band[:, None] + np.arange(-band_reach, band_reach + 1)
+        slot = np.minimum(np.searchsorted(self.band_keys, bands), len(self.band_keys) - 1)
+        present = self.band_keys[slot] == bands
+        starts = np.where(present, self.band_starts[slot], 0)
+        ends = np.where(present, self.band_ends[slot], 0)
+        insert = np.searchsorted(self._sorted_keys(), bands * BAND_KEY_STRIDE + (lons[:, None] + 180.0))
+        insert = np.clip(insert, starts, ends)
+
+        positions = insert[:, :, None] + np.arange(-lon_reach, lon_reach)
+        valid = ((positions >= starts[:, :, None]) & (positions < ends[:, :, None])).reshape(len(lats), -1)
+        positions = np.where(valid, positions.reshape(len(lats), -1), 0)
+        q_lat, q_lon = np.radians(lats)[:, None], np.radians(lons)[:, None]
+        a = (np.sin((self.coords.lat_rad[positions] - q_lat) / 2) ** 2
+             + np.cos(q_lat) * self.coords.cos_lat[positions] * np.sin((self.coords.lon_rad[positions] - q_lon) / 2) ** 2)
+        matrix = np.where(valid, 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))), np.inf)
+        best = matrix.argmin(axis=1)
+        rows = np.arange(len(lats))
+        hits, distances = positions[rows, best], matrix[rows, best]
+
+        # Longitude gap to the nearest point not looked at on either side; past the
+        # antimeridian the far end of a band comes back within reach
+        left, right = insert - lon_reach - 1, insert + lon_reach
+        q = lons[:, None]
+        gap_left = np.where(left >= starts, np.minimum(q - self.lon[np.maximum(left, 0)], 180.0 - q), np.inf)
+        gap_right = np.where(right < ends, np.minimum(self.lon[np.minimum(right, len(self) - 1)] - q, 180.0 + q),
+                             np.inf)
+        edges = np.radians(np.clip(bands[:, :, None] + np.array([0, 1]), -90.0 / cell, 90.0 / cell) * cell)
+        band_cos = np.cos(edges).min(axis=2)
+        scale = np.sqrt(np.cos(q_lat) * band_cos)
+        bound = np.inf
+        for gap in (gap_left, gap_right):
+            half = np.radians(np.clip(np.where(np.isfinite(gap), gap, 0.0), 0.0, 180.0)) / 2
+            gap_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(scale * np.sin(half), 0.0, 1.0))
+            bound = np.minimum(bound, np.where(np.isfinite(gap), gap_km, np.inf).min(axis=1))
+        south, north = (q_band - band_reach) * cell, (q_band + band_reach + 1) * cell
+        bound = np.minimum(bound, EARTH_RADIUS_KM * np.radians(np.minimum(lats - south, north - lats)))
+        return hits, distances, distances <= bound
+
+    def query_nearest_batch(self, lats, lons) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, distances_km) of the nearest point for each query point.
+
+        Small indexes are answered with chunked distance matrices. Larger ones first compare
+        each point with its longitude neighbours in the surrounding bands (BATCH_WINDOWS) and
+        look up only the points that check cannot settle one at a time. Ids are -1
+        (distance inf) when the index is empty.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        ids = np.full(len(lats), -1, dtype=np.int64)
+        distances = np.full(len(lats), np.inf)
+        if len(self) == 0:
+            return ids, distances
+
+        if len(self) <= BATCH_MATRIX_MAX_ROWS:
+            chunk = max(1, BATCH_MATRIX_MAX_CELLS // len(self))
+            for start in range(0, len(lats), chunk):
+                matrix = self.coords.distances_from(lats[start:start + chunk], lons[start:start + chunk])
+                positions = matrix.argmin(axis=1)
+                ids[start:start + chunk] = self.ids[positions]
+                distances[start:start + chunk] = matrix[np.arange(len(positions)), positions]
+            return ids, distances
+
+        pending = np.arange(len(lats))
+        for band_reach, lon_reach in BATCH_WINDOWS:
+            chunk = max(1, BATCH_MATRIX_MAX_CELLS // ((2 * band_reach + 1) * 2 * lon_reach))
+            unresolved = []
+            for start in range(0, len(pending), chunk):
+                part = pending[start:start + chunk]
+                positions, found, exact = self._nearest_in_window(lats[part], lons[part], band_reach, lon_reach)
+                ids[part[exact]], distances[part[exact]] = self.ids[positions[exact]], found[exact]
+                unresolved.append(part[~exact])
+            pending = np.concatenate(unresolved) if unresolved else pending[:0]
+
+        for i in pending:
+            hit_ids, hit_distances = self.query_nearest(lats[i], lons[i], k=1)
+            ids[i], distances[i] = hit_ids[0], hit_distances[0]
+        return ids, distances
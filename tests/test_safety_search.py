@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from chatbot import IsraelSafetyRAGBot
+from location_store import LocationStore, compact_frame
+from spatial import haversine_km
+
+USER = (32.0, 34.8)
+KM_LAT = 1 / 111.195  # degrees of latitude per kilometre
+
+
+def make_bot(rows) -> IsraelSafetyRAGBot:
+    df = pd.DataFrame(rows, columns=['type', 'lat', 'lon'])
+    df['city'] = "Test"
+    df['source_file'] = "test.csv"
+    bot = IsraelSafetyRAGBot(model_name="test")
+    bot.store = LocationStore.from_frames([compact_frame(df)])
+    return bot
+
+
+def test_k_nearest_skips_danger_without_losing_closer_types():
+    lat, lon = USER
+    bot = make_bot([
+        ('bunker', lat + 1 * KM_LAT, lon), ('bunker', lat + 2 * KM_LAT, lon), ('bunker', lat + 3 * KM_LAT, lon),
+        ('bomb', lat + 1 * KM_LAT, lon + 0.0001), ('bomb', lat + 2 * KM_LAT, lon + 0.0001),
+        ('shelter', lat - 10 * KM_LAT, lon), ('shelter', lat - 11 * KM_LAT, lon),
+    ])
+
+    results = bot.find_k_nearest_safety_locations(lat, lon, k=2, avoid_danger_km=0.1)
+
+    assert [(r['type'], round(r['distance_km'])) for r in results] == [('bunker', 3), ('shelter', 10)]
+    within = bot.find_locations_within(lat, lon, 20, avoid_danger_km=0.1)
+    assert [r['distance_km'] for r in results] == [r['distance_km'] for r in within[:2]]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_k_nearest_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    n = 2000
+    types = rng.choice(['bunker', 'shelter', 'bomb', 'shooting'], n, p=[0.3, 0.2, 0.3, 0.2])
+    lats = rng.uniform(31.5, 32.5, n)
+    lons = rng.uniform(34.5, 35.2, n)
+    bot = make_bot(list(zip(types, lats, lons)))
+    lat, lon = rng.uniform(31.7, 32.3), rng.uniform(34.6, 35.1)
+    avoid_km = 1.5
+
+    danger = np.isin(types, ['bomb', 'shooting'])
+    safe = [i for i in np.flatnonzero(~danger)
+            if haversine_km(lats[i], lons[i], lats[danger], lons[danger]).min() > avoid_km]
+    expected = np.sort(haversine_km(lat, lon, lats[safe], lons[safe]))[:10]
+
+    results = bot.find_k_nearest_safety_locations(lat, lon, k=10, avoid_danger_km=avoid_km)
+
+    np.testing.assert_allclose([r['distance_km'] for r in results], np.round(expected, 2), atol=0.01)
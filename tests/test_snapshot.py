@@ -0,0 +1,17 @@
+import pandas as pd
+
+from location_store import LocationStore, compact_frame
+from snapshot import load_snapshot, save_snapshot
+
+
+def test_snapshot_reused_only_for_the_same_source_order(tmp_path):
+    df = pd.DataFrame({'type': ['bunker', 'shelter'], 'lat': [32.0, 31.5], 'lon': [34.8, 35.0],
+                       'city': ["Test", "Test"], 'source_file': ["a.csv", "b.csv"]})
+    store = LocationStore.from_frames([compact_frame(df)])
+    sources = {"a.csv": {"sha256": "aaa"}, "b.csv": {"sha256": "bbb"}}
+    save_snapshot(store, str(tmp_path), sources)
+
+    loaded = load_snapshot(str(tmp_path), sources)
+    assert loaded is not None and len(loaded) == len(store)
+    assert load_snapshot(str(tmp_path), {"b.csv": {"sha256": "bbb"}, "a.csv": {"sha256": "aaa"}}) is None
+    assert load_snapshot(str(tmp_path), {"a.csv": {"sha256": "aaa"}, "b.csv": None}) is None
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from spatial import BATCH_MATRIX_MAX_ROWS, GeoIndex, haversine_km
+
+
+def brute_nearest(lat, lon, q_lats, q_lons) -> np.ndarray:
+    return np.array([haversine_km(q_lat, q_lon, lat, lon).min() for q_lat, q_lon in zip(q_lats, q_lons)])
+
+
+@pytest.mark.parametrize("layout", ["dense", "world", "clustered"])
+def test_nearest_batch_matches_brute_force(layout):
+    rng = np.random.default_rng(7)
+    n = 6 * BATCH_MATRIX_MAX_ROWS
+    if layout == "dense":
+        lat, lon = rng.uniform(29.5, 33.3, n), rng.uniform(34.2, 35.9, n)
+    elif layout == "world":
+        lat, lon = rng.uniform(-89, 89, n), rng.uniform(-180, 180, n)
+    else:
+        # One tight cluster and a few outliers on both sides of the antimeridian
+        lat = np.r_[rng.normal(31, 0.01, n - 6), rng.uniform(-60, 60, 6)]
+        lon = np.r_[rng.normal(35, 0.01, n - 6), [-179.99, 179.99] * 3]
+    index = GeoIndex(lat, lon)
+
+    q_lats = np.r_[rng.uniform(29, 34, 300), rng.uniform(-89.9, 89.9, 300)]
+    q_lons = np.r_[rng.uniform(34, 36, 300), rng.uniform(-180, 180, 250), [-180.0, 180.0] * 25]
+    ids, distances = index.query_nearest_batch(q_lats, q_lons)
+
+    expected = brute_nearest(lat, lon, q_lats, q_lons)
+    np.testing.assert_allclose(distances, expected, atol=1e-9)
+    np.testing.assert_allclose(haversine_km(q_lats, q_lons, lat[ids], lon[ids]), expected, atol=1e-9)
+
+
+def test_nearest_batch_small_index_and_empty():
+    rng = np.random.default_rng(3)
+    lat, lon = rng.uniform(29.5, 33.3, 50), rng.uniform(34.2, 35.9, 50)
+    q_lats, q_lons = rng.uniform(29, 34, 40), rng.uniform(34, 36, 40)
+
+    _, distances = GeoIndex(lat, lon).query_nearest_batch(q_lats, q_lons)
+    np.testing.assert_allclose(distances, brute_nearest(lat, lon, q_lats, q_lons), atol=1e-9)
+
+    ids, distances = GeoIndex(np.empty(0), np.empty(0)).query_nearest_batch(q_lats, q_lons)
+    assert (ids == -1).all() and np.isinf(distances).all()